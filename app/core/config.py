@@ -1,6 +1,11 @@
+from pathlib import Path
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from typing import Optional
 
+# The app package directory; relative data paths are resolved against it, not the CWD
+APP_DIR = Path(__file__).resolve().parent.parent
+
 class Settings(BaseSettings):
 	"""Application settings with BigQuery configuration."""
 	# Google Cloud Settings
@@ -8,10 +13,48 @@ class Settings(BaseSettings):
 	GOOGLE_APPLICATION_CREDENTIALS: str
 	BIGQUERY_DATASET_ID: str
 	BIGQUERY_TABLE_ID: str
+	BIGQUERY_TABLE_CACHE_TTL_SECONDS: int = 300
+	# Connections kept to BigQuery, and worker threads allowed to use them at once
+	BIGQUERY_HTTP_POOL_SIZE: int = 64
+	# Let BigQuery run small queries without creating a job (short query optimized mode)
+	BIGQUERY_SHORT_MODE: bool = True
 	
 	# Embedding Model Settings
 	EMBEDDING_MODEL_NAME: str = "embedding_model"
 	EMBEDDING_TABLE_NAME: str = "ticket_embeddings"
+	EMBEDDING_CACHE_SIZE: int = 1000
+	EMBEDDING_CACHE_INT8: bool = True
+	EMBEDDING_STORE_CACHE_ENABLED: bool = True
+	EMBEDDING_BATCH_WINDOW_MS: int = 10
+	EMBEDDING_BATCH_MAX_SIZE: int = 64
+	EMBEDDING_MAX_CHARS: int = 8000  # ~2048 tokens, text-embedding-004's input limit
+	# Persist generated embeddings here so restarts skip re-embedding; unset disables it
+	EMBEDDING_DISK_CACHE_DIR: Optional[str] = None
+	EMBEDDING_DISK_CACHE_FLUSH_EVERY: int = 64
+	# Opt-in: answer a miss with a recent near-identical text's embedding (simhash within
+	# this many bits). A few bits can flip meaning ("can" vs "cannot"); 0 size disables it
+	EMBEDDING_FUZZY_CACHE_SIZE: int = 0
+	EMBEDDING_FUZZY_CACHE_MAX_DISTANCE: int = 4
+
+	# Vector Index Settings
+	VECTOR_INDEX_ENABLED: bool = True
+	VECTOR_INDEX_EXACT_SEARCH_MAX: int = 20000
+	VECTOR_INDEX_INT8: bool = True
+	PCA_COMPONENTS_PATH: str = "data/pca.npz"
+
+	# Semantic Search Cache Settings
+	SEARCH_CACHE_SIZE: int = 256
+	SEARCH_CACHE_MIN_SIMILARITY: float = 0.98
+	SEARCH_CACHE_TTL_SECONDS: int = 60
+
+	# Health Check Settings
+	HEALTH_CHECK_INTERVAL_SECONDS: int = 30
+
+	@field_validator("PCA_COMPONENTS_PATH", "EMBEDDING_DISK_CACHE_DIR")
+	@classmethod
+	def resolve_app_path(cls, value: Optional[str]) -> Optional[str]:
+		"""Resolve a relative path against the app package directory."""
+		return str(APP_DIR / value) if value else value
 
 	class Config:
 		env_file = ".env"
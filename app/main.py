@@ -1,23 +1,25 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import base64
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from typing import Any, Dict, Type, TypeVar
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ValidationError
+from app.core.config import settings
 from app.services.bigquery_service import bigquery_service
 from app.services.embedding_service import embedding_service
 from app.services.retrieval_service import retrieval_service
 from fastapi.middleware.cors import CORSMiddleware
 from app.models.embeddings import EmbeddingRequest, EmbeddingResponse, EmbeddingTicketRequest, SimilarSearchRequest
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"], # Default react port
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/health")
-async def health_check():
-    """Health check endpoint to verify BigQuery connection."""	
+async def _check_health() -> Dict[str, str]:
+    """Probe the BigQuery connection and build the /health payload."""
     try:
         connection_status = await bigquery_service.test_connection()
         if connection_status["status"] != "success":
@@ -33,7 +35,84 @@ async def health_check():
         return {
             "status": "unhealthy",
             "message": f"BigQuery connection failed: {str(e)}"
-		}
+        }
+
+async def _health_refresher():
+    """Refresh app.state.health in the background so probes never hit BigQuery."""
+    while True:
+        app.state.health = await _check_health()
+        await asyncio.sleep(settings.HEALTH_CHECK_INTERVAL_SECONDS)
+
+async def _load_vector_index():
+    """Warm the in-process vector index; searches use BigQuery until it is ready."""
+    try:
+        count = await retrieval_service.load_index()
+        logger.info("Loaded %d ticket embeddings into the vector index", count)
+    except Exception as e:
+        logger.error("Failed to load vector index, falling back to BigQuery search: %s", e, exc_info=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background health refreshing and vector index loading for the app's lifetime."""
+    # Blocking BigQuery calls run via asyncio.to_thread; the default executor (at
+    # most 32 threads) would cap them below the client's HTTP connection pool
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=settings.BIGQUERY_HTTP_POOL_SIZE)
+    )
+    app.state.health = {
+        "status": "unhealthy",
+        "message": "Health check pending"
+    }
+    background = [asyncio.create_task(_health_refresher())]
+    if settings.VECTOR_INDEX_ENABLED:
+        background.append(asyncio.create_task(_load_vector_index()))
+    yield
+    for task in background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    embedding_service.flush_disk_cache()
+
+# orjson serializes ticket lists and 768-float embeddings several times faster than stdlib json
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000"], # Default react port
+    allow_credentials=True,
+    # Static allow-lists: wildcards make Starlette echo request headers back per request
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+)
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+async def _parse_body(request: Request, model: Type[ModelT]) -> ModelT:
+    """Validate a JSON request body directly from bytes, skipping json.loads."""
+    try:
+        return model.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+def _json_body(model: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI request body for routes that parse their JSON body with _parse_body."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}}
+        }
+    }
+
+def _decode_vector(payload: bytes) -> np.ndarray:
+    """Decode a little-endian float32 buffer into an embedding vector."""
+    return np.frombuffer(payload, dtype="<f4")
+
+@app.get("/health")
+async def health_check():
+    """Health check endpoint reporting the latest background BigQuery probe."""
+    return app.state.health
 
 @app.get('/tickets')
 async def get_tickets(limit: int = 100):
@@ -57,20 +136,27 @@ async def get_ticket_by_id(ticket_id: int):
         )
     return ticket
 
-@app.post("/embedding", response_model=EmbeddingResponse)
-async def generate_embedding(request: EmbeddingRequest):
+@app.post("/embedding", response_model=EmbeddingResponse, openapi_extra=_json_body(EmbeddingRequest))
+async def generate_embedding(http_request: Request):
     """Generate embedding for plain text using the embedding service."""
+    request = await _parse_body(http_request, EmbeddingRequest)
+    # Reject unusable input before it reaches the cache or BigQuery ML
+    if not request.text or not request.text.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Text cannot be empty or None"
+        )
+    if len(request.text) > settings.EMBEDDING_MAX_CHARS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Text exceeds {settings.EMBEDDING_MAX_CHARS} characters"
+        )
+
     try:
-        if not request.text or not request.text.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Text cannot be empty or None"
-            )
-        
         embedding = await embedding_service.generate_embedding(request.text)
         
         return EmbeddingResponse(
-            embedding=embedding,
+            embedding=embedding.tolist(),
             dimension=len(embedding),
             text=request.text
         )
@@ -94,7 +180,7 @@ async def store_ticket_embedding(ticket_id: int, request: EmbeddingTicketRequest
     try:
         result = await embedding_service.store_embedding(
             ticket_id=ticket_id,
-            vector=request.vector,
+            vector=_decode_vector(base64.b64decode(request.vector_b64, validate=True)),
             ticket_resolution=request.ticket_resolution,
             upsert=True  # allow update if already exists
         )
@@ -104,12 +190,32 @@ async def store_ticket_embedding(ticket_id: int, request: EmbeddingTicketRequest
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to store embedding: {str(e)}")
 
-@app.post("/search/similar")
-async def search_similar(req: SimilarSearchRequest):
+@app.post("/embedding/store/{ticket_id}/raw")
+async def store_ticket_embedding_raw(ticket_id: int, request: Request, ticket_resolution: str = ""):
+    """
+    Store an embedding sent as a raw float32 request body (application/octet-stream).
+    Bypasses pydantic body validation entirely.
+    """
+    try:
+        result = await embedding_service.store_embedding(
+            ticket_id=ticket_id,
+            vector=_decode_vector(await request.body()),
+            ticket_resolution=ticket_resolution,
+            upsert=True
+        )
+        return result
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store embedding: {str(e)}")
+
+@app.post("/search/similar", openapi_extra=_json_body(SimilarSearchRequest))
+async def search_similar(request: Request):
   """
   Semantic similarity search over tickets.
   Returns [] on no matches (no 404), consistent with other endpoints' graceful behavior.
   """
+  req = await _parse_body(request, SimilarSearchRequest)
   try:
     results = await retrieval_service.search_similar_tickets(req.query, req.limit)
     return results
@@ -1,20 +1,30 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List
 
-# Pydantic models for embedding request/response
+# Pydantic models for embedding request/response. Models are immutable and
+# drop unknown keys so request bodies can be validated straight from JSON bytes.
 class EmbeddingRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     text: str
 
 class EmbeddingResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     embedding: List[float]
     dimension: int
     text: str
 
-# Request body schema for storing an embedding
+# Request body schema for storing an embedding. The vector is sent as a
+# base64-encoded little-endian float32 buffer rather than a JSON list of floats.
 class EmbeddingTicketRequest(BaseModel):
-    vector: List[float]
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    vector_b64: str
     ticket_resolution: str
 
 class SimilarSearchRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     query: str = Field(min_length=1)
     limit: int = Field(default=5, ge=1, le=50)
@@ -1,7 +1,92 @@
+import asyncio
+import threading
+import time
+from functools import lru_cache
 from google.cloud import bigquery
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud.bigquery_storage import BigQueryReadClient
 from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+import pyarrow as pa
 from app.core.config import settings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+# Fields returned for every ticket read
+TICKET_FIELDS = [
+	"ticket_id",
+	"ticket_subject",
+	"ticket_description",
+	"ticket_resolution",
+	"ticket_status"
+]
+TICKET_FIELDS_SQL = ", ".join(TICKET_FIELDS)
+
+# Fixed, parameterized SQL so repeated reads hit BigQuery's query result cache
+TICKETS_QUERY = """
+	SELECT {fields}
+	FROM `{table}`
+	LIMIT @limit
+"""
+
+TICKET_BY_ID_QUERY = """
+	SELECT {fields}
+	FROM `{table}`
+	WHERE ticket_id = @ticket_id
+	LIMIT 1
+"""
+
+@lru_cache(maxsize=None)
+def _load_credentials(path: str) -> service_account.Credentials:
+	"""Read and parse a service account key file once per process."""
+	return service_account.Credentials.from_service_account_file(path)
+
+# Process-wide BigQuery clients, keyed by (project, key file path)
+_CLIENT_CACHE: Dict[Tuple[str, str], bigquery.Client] = {}
+_CLIENT_LOCK = threading.Lock()
+
+def _get_client(project: str, credentials_path: str) -> bigquery.Client:
+	"""Return the process-wide BigQuery client for a project and key file.
+
+	Creation is double-checked under a lock, so threads racing on first use
+	still end up sharing one client.
+	"""
+	key = (project, credentials_path)
+	client = _CLIENT_CACHE.get(key)
+	if client is None:
+		with _CLIENT_LOCK:
+			client = _CLIENT_CACHE.get(key)
+			if client is None:
+				client = _CLIENT_CACHE[key] = _create_client(project, credentials_path)
+	return client
+
+def _create_client(project: str, credentials_path: str) -> bigquery.Client:
+	"""Build a BigQuery client for a project and key file.
+
+	The client talks over one authorized session whose connection pool is sized
+	for the worker threads issuing queries, so concurrent calls reuse warm
+	TLS connections instead of handshaking (or queueing) per request.
+	"""
+	credentials = _load_credentials(credentials_path).with_scopes(bigquery.Client.SCOPE)
+	session = AuthorizedSession(credentials)
+	session.mount("https://", HTTPAdapter(
+		pool_connections=settings.BIGQUERY_HTTP_POOL_SIZE,
+		pool_maxsize=settings.BIGQUERY_HTTP_POOL_SIZE
+	))
+	return bigquery.Client(
+		project=project,
+		credentials=credentials,
+		_http=session,
+		default_job_creation_mode=(
+			bigquery.enums.JobCreationMode.JOB_CREATION_OPTIONAL if settings.BIGQUERY_SHORT_MODE else None
+		)
+	)
+
+def get_bigquery_client() -> bigquery.Client:
+	"""Return the process-wide BigQuery client for the configured project and key file."""
+	return _get_client(
+		settings.GOOGLE_CLOUD_PROJECT,
+		settings.GOOGLE_APPLICATION_CREDENTIALS
+	)
 
 class BigQueryService:
 	"""Service for handling BigQuery operations."""
@@ -17,21 +102,41 @@ class BigQueryService:
 		self.dataset_id = dataset_id
 		self.table_id = table_id
 		self.table_ref = self.client.dataset(self.dataset_id).table(self.table_id)
+		self._bqstorage_client: Optional[BigQueryReadClient] = None
+		self._table: Optional[bigquery.Table] = None
+		self._table_fetched_at = 0.0
+
+		self._table_fqn = f"{settings.GOOGLE_CLOUD_PROJECT}.{self.dataset_id}.{self.table_id}"
+		self._tickets_query = TICKETS_QUERY.format(fields=TICKET_FIELDS_SQL, table=self._table_fqn)
+		self._ticket_by_id_query = TICKET_BY_ID_QUERY.format(fields=TICKET_FIELDS_SQL, table=self._table_fqn)
 	
 	def _initialize_client(self) -> bigquery.Client:
-		"""Initialize and return a BigQuery client with proper authentication."""
-		credentials = service_account.Credentials.from_service_account_file(
-			settings.GOOGLE_APPLICATION_CREDENTIALS
-		)
-		return bigquery.Client(
-			project=settings.GOOGLE_CLOUD_PROJECT,
-			credentials=credentials
-		)
+		"""Return the shared, authenticated BigQuery client for the configured project."""
+		self.credentials = _load_credentials(settings.GOOGLE_APPLICATION_CREDENTIALS)
+		return get_bigquery_client()
+
+	def _get_bqstorage_client(self) -> BigQueryReadClient:
+		"""Return the BigQuery Storage Read API client, creating it on first use."""
+		if self._bqstorage_client is None:
+			self._bqstorage_client = BigQueryReadClient(credentials=self.credentials)
+		return self._bqstorage_client
 	
+	async def _get_table(self, fresh: bool = False) -> bigquery.Table:
+		"""Return the configured table's metadata, re-fetching it at most once per TTL.
+		
+		Args:
+			fresh: Always fetch from BigQuery (refreshing the cached copy)
+		"""
+		now = time.monotonic()
+		if fresh or self._table is None or now - self._table_fetched_at > settings.BIGQUERY_TABLE_CACHE_TTL_SECONDS:
+			self._table = await asyncio.to_thread(self.client.get_table, self.table_ref)
+			self._table_fetched_at = now
+		return self._table
+
 	async def get_table_schema(self) -> List[Dict[str, Any]]:
 		"""Get the schema of the configured table."""
 		try:
-			table = self.client.get_table(self.table_ref)
+			table = await self._get_table()
 			return [
 				{
 					"name": field.name,
@@ -43,36 +148,52 @@ class BigQueryService:
 		except Exception as e:
 			raise Exception(f"Failed to get table schema: {str(e)}")
 	
-	async def query_table(self,
-					   select_fields: List[str],
-					   where_clause: Optional[str] = None,
-					   order_by: Optional[str] = None,
-					   limit: Optional[int] = None) -> List[Dict[str, Any]]:
-		"""Query the configured table with optional filtering and ordering.
+	async def _run_query(self,
+					   query: str,
+					   query_parameters: Optional[List[Any]] = None,
+					   use_storage_api: bool = False) -> List[Dict[str, Any]]:
+		"""Run a (optionally parameterized) query off the event loop.
 		
 		Args:
-			select_fields: List of fields to select
-			where_clause: Optional WHERE clause for filtering
-			order_by: Optional ORDER BY clause
-			limit: Optional limit on the number of rows returned
+			query: SQL text, referencing parameters as @name
+			query_parameters: BigQuery query parameters bound to the SQL
+			use_storage_api: Stream results as Arrow via the BigQuery Storage Read API
 		
 		Returns:
 			List[Dict[str, Any]]: List of query results
 		"""
-		fields = ", ".join(select_fields)
-		query = f"""
-			SELECT {fields}
-			FROM `{settings.GOOGLE_CLOUD_PROJECT}.{self.dataset_id}.{self.table_id}`
-			{f"WHERE {where_clause}" if where_clause else ""}
-			{f"ORDER BY {order_by}" if order_by else ""}
-			{f"LIMIT {limit}" if limit is not None else ""}
+		job_config = bigquery.QueryJobConfig(
+			query_parameters=query_parameters or [],
+			use_query_cache=True
+		)
+		return await asyncio.to_thread(self._sync_query, query, job_config, use_storage_api)
+
+	def _sync_query(self,
+				 query: str,
+				 job_config: Optional[bigquery.QueryJobConfig] = None,
+				 use_storage_api: bool = False) -> List[Dict[str, Any]]:
+		"""Run a query with the blocking client and materialize its rows.
+
+		Called through asyncio.to_thread so it never blocks the event loop. Bulk
+		reads decode columnar Arrow record batches instead of paging rows over REST.
 		"""
+		if use_storage_api:
+			return self.query_arrow(query, job_config).to_pylist()
+		return [dict(row) for row in self.client.query_and_wait(query, job_config=job_config)]
 
-		try:
-			query_job = self.client.query(query)
-			return [dict(row) for row in query_job.result()]
-		except Exception as e:
-			raise Exception(f"Failed to query table: {str(e)}")
+	def query_arrow(self,
+				 query: str,
+				 job_config: Optional[bigquery.QueryJobConfig] = None) -> pa.Table:
+		"""Run a query with the blocking client and return its rows as an Arrow table.
+
+		Large results are streamed through the BigQuery Storage Read API. Queries
+		go through query_and_wait, so with BIGQUERY_SHORT_MODE small ones run
+		without creating a job. Call it from a worker thread (asyncio.to_thread),
+		never directly on the event loop.
+		"""
+		return self.client.query_and_wait(query, job_config=job_config).to_arrow(
+			bqstorage_client=self._get_bqstorage_client()
+		)
 
 	async def get_tickets(self, limit: int = 100) -> List[Dict]:
 		"""Get tickets with specific fields from the table.
@@ -83,19 +204,11 @@ class BigQueryService:
 		Returns:
 			List[Dict[str, Any]]: List of tickets with specified fields
 		"""
-
-		select_fields = [
-			"ticket_id",
-			"ticket_subject",
-			"ticket_description",
-			"ticket_resolution",
-			"ticket_status"
-		]
-
 		try:
-			return await self.query_table(
-				select_fields=select_fields,
-				limit=limit
+			return await self._run_query(
+				self._tickets_query,
+				[bigquery.ScalarQueryParameter("limit", "INT64", limit)],
+				use_storage_api=True
 			)
 		except Exception as e:
 			raise Exception(f"Failed to get tickets: {str(e)}")
@@ -109,72 +222,61 @@ class BigQueryService:
 		Returns:
 			Dict: The ticket with the specified ID or None if not found
 		"""
-
-		select_fields = [
-			"ticket_id",
-			"ticket_subject",
-			"ticket_description",
-			"ticket_resolution",
-			"ticket_status"
-		]
-
 		try:
-			results = await self.query_table(
-				select_fields=select_fields,
-				where_clause=f"ticket_id = {ticket_id}"
+			results = await self._run_query(
+				self._ticket_by_id_query,
+				[bigquery.ScalarQueryParameter("ticket_id", "INT64", ticket_id)]
 			)
 			return results[0] if results else None
 		except Exception as e:
 			raise Exception(f"Failed to get ticket by ID: {str(e)}")
 
-	async def batch_embed_tickets(self, limit: int = 100) -> int:
+	async def batch_embed_tickets(self, limit: int = 100, concurrency: int = 10) -> int:
 		"""Batch embed and store resolved tickets using description only.
 		
 		This method:
 		- Gets all tickets using get_tickets(limit)
 		- Filters for resolved tickets only
-		- Embeds only the ticket description (for similarity search)
+		- Embeds only the ticket descriptions (for similarity search), in batch jobs
 		- Stores the resolution for easy retrieval when similar tickets are found
 		
+		Embedding and storing run as a pipeline (EmbeddingService.ingest_tickets),
+		with up to `concurrency` stores in flight.
+		
 		Args:
 			limit: Maximum limit of tickets to process
+			concurrency: Maximum number of in-flight store calls
 		
 		Returns:
 			int: Number of resolved tickets processed
 		"""
+		# Imported here to avoid a circular import with embedding_service
+		from app.services.embedding_service import embedding_service
+
 		try:
-			tickets = await self.get_tickets(limit=limit)
-			processed_count = 0
+			tickets = [ticket for ticket in await self.get_tickets(limit=limit) if self._should_embed(ticket)]
 			
-			for ticket in tickets:
-				# Only process resolved tickets
-				if ticket.get("ticket_status") != "resolved":
-					continue
-				
-				# Only embed the description for similarity search
-				description = ticket.get("ticket_description", "")
-				
-				# Skip tickets with no meaningful description
-				if not description or not description.strip():
-					print(f"Skipping ticket {ticket['ticket_id']} - no meaningful description to embed")
-					continue
-				
-				# Generate embedding for the description only
-				embedding = await embedding_service.generate_embedding(description)
-				
-				# Store the embedding with the resolution for easy retrieval
-				await embedding_service.store_embedding(
-					ticket_id=ticket["ticket_id"], 
-					vector=embedding, 
-					ticket_resolution=ticket.get("ticket_resolution", "")
-				)
-				
-				processed_count += 1
-				print(f"Processed resolved ticket {ticket['ticket_id']}: {len(description)} chars")
-			
-			return processed_count
+			# Only embed the description for similarity search
+			return await embedding_service.ingest_tickets(
+				tickets,
+				prepare=lambda ticket: ticket["ticket_description"],
+				upsert_workers=concurrency
+			)
 		except Exception as e:
 			raise Exception(f"Failed to batch embed tickets: {str(e)}")
+
+	def _should_embed(self, ticket: Dict[str, Any]) -> bool:
+		"""Return True if the ticket is resolved and has a description to embed."""
+		# Only process resolved tickets
+		if ticket.get("ticket_status") != "resolved":
+			return False
+		
+		# Skip tickets with no meaningful description
+		description = ticket.get("ticket_description", "")
+		if not description or not description.strip():
+			print(f"Skipping ticket {ticket['ticket_id']} - no meaningful description to embed")
+			return False
+		return True
 	
 	async def test_connection(self) -> Dict[str, str]:
 		"""Test the BigQuery connection and table access.
@@ -183,7 +285,8 @@ class BigQueryService:
 			Dict[str, str]: Status of the connection test and table access test
 		"""
 		try:
-			self.client.get_table(self.table_ref)
+			# Bypass the metadata cache so a lost connection shows up immediately
+			await self._get_table(fresh=True)
 			return {
 				"status": "success",
 				"message": f"Successfully accessed table {self.dataset_id}.{self.table_id}"
@@ -4,72 +4,559 @@ EmbeddingService class for generating text embeddings using BigQuery ML's native
 
 from google.cloud import bigquery
 from app.core.config import settings
-from app.services.bigquery_service import BigQueryService
-from typing import List, Dict, Any, Optional
+from app.services.bigquery_service import bigquery_service
+from app.services.vector_index import EMBEDDING_DIMENSION, quantize_int8, vector_index
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import List, Dict, Any, AsyncIterable, AsyncIterator, Callable, Iterable, Optional, Set, Tuple, Union
+import asyncio
+import fcntl
+import hashlib
 import logging
+import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import unicodedata
+
+__all__ = ["EmbeddingService", "embedding_service"]
 
 logger = logging.getLogger(__name__)
 
+# SQL templates, formatted with table/model names once per service in __init__
+EMBED_QUERY = """
+SELECT ml_generate_embedding_result AS embedding
+FROM ML.GENERATE_EMBEDDING(
+    MODEL `{model}`,
+    (SELECT content, idx FROM UNNEST(@texts) AS content WITH OFFSET idx),
+    STRUCT(TRUE AS flatten_json_output)
+)
+ORDER BY idx
+"""
+
+STORED_EMBEDDINGS_QUERY = """
+SELECT text_hash, ANY_VALUE(embedding_vector) AS embedding
+FROM `{table}`
+WHERE text_hash IN UNNEST(@text_hashes)
+GROUP BY text_hash
+"""
+
+# Idempotent write: update existing rows by ticket_id or insert new ones.
+# embedding_int8/embedding_scale hold the same vector quantized to int8 (768 bytes
+# instead of 6 KB), which is all the in-process index load has to scan.
+MERGE_EMBEDDINGS_QUERY = """
+MERGE `{table}` T
+USING (
+  SELECT ticket_id, embedding_vector, embedding_int8, embedding_scale, ticket_resolution, text_hash
+  FROM UNNEST(@rows)
+) S
+ON T.ticket_id = S.ticket_id
+WHEN MATCHED THEN
+  UPDATE SET
+    embedding_vector = S.embedding_vector,
+    embedding_int8 = S.embedding_int8,
+    embedding_scale = S.embedding_scale,
+    ticket_resolution = S.ticket_resolution,
+    text_hash = S.text_hash
+WHEN NOT MATCHED THEN
+  INSERT (ticket_id, embedding_vector, embedding_int8, embedding_scale, ticket_resolution, text_hash)
+  VALUES (S.ticket_id, S.embedding_vector, S.embedding_int8, S.embedding_scale, S.ticket_resolution, S.text_hash);
+"""
+
+# Insert only (will error if duplicate ticket_id and a uniqueness rule exists externally)
+INSERT_EMBEDDINGS_QUERY = """
+INSERT INTO `{table}` (ticket_id, embedding_vector, embedding_int8, embedding_scale, ticket_resolution, text_hash)
+SELECT ticket_id, embedding_vector, embedding_int8, embedding_scale, ticket_resolution, text_hash
+FROM UNNEST(@rows);
+"""
+
+
+# One disk cache entry: sha256 cache key, int8 scale and int8 codes (804 bytes)
+_DISK_RECORD = np.dtype([("key", "V32"), ("scale", "<f4"), ("codes", "i1", (EMBEDDING_DIMENSION,))])
+
+
+# (field name, prefixed column name, "Label: " prefix) for each section of a ticket's text
+_TICKET_FIELDS = (
+    ("subject", "ticket_subject", "Subject: "),
+    ("description", "ticket_description", "Issue: "),
+    ("resolution", "ticket_resolution", "Resolution: "),
+)
+
+
+def _normalize_text(text: str) -> str:
+    """Normalize text for cache lookups: NFKC, stripped, lowercased."""
+    return unicodedata.normalize("NFKC", text).strip().lower()
+
 
 class EmbeddingService:
     """Service for generating text embeddings using BigQuery ML's native embedding functions."""
 
     def __init__(self):
         """Initialize EmbeddingService with BigQuery connection."""
-        self.bigquery_service = BigQueryService(
-            dataset_id=settings.BIGQUERY_DATASET_ID,
-            table_id=settings.BIGQUERY_TABLE_ID
-        )
+        # Share the process-wide BigQuery service (and its client) rather than building another
+        self.bigquery_service = bigquery_service
         self.client = self.bigquery_service.client
         self.project_id = settings.GOOGLE_CLOUD_PROJECT
         self.dataset_id = settings.BIGQUERY_DATASET_ID
 
-    async def generate_embedding(self, text: str) -> List[float]:
+        embeddings_table = f"{self.project_id}.embeddings.{settings.EMBEDDING_TABLE_NAME}"
+        self._embed_query = EMBED_QUERY.format(
+            model=f"{self.project_id}.{self.dataset_id}.{settings.EMBEDDING_MODEL_NAME}"
+        )
+        self._stored_embeddings_query = STORED_EMBEDDINGS_QUERY.format(table=embeddings_table)
+        self._merge_embeddings_query = MERGE_EMBEDDINGS_QUERY.format(table=embeddings_table)
+        self._insert_embeddings_query = INSERT_EMBEDDINGS_QUERY.format(table=embeddings_table)
+
+        # LRU cache of generated embeddings keyed by a hash of the normalized text, holding
+        # (int8 codes, scale) pairs when EMBEDDING_CACHE_INT8 is set, else float32 vectors.
+        # Only touched from the event loop, so no locking is needed around it.
+        self._embedding_cache: "OrderedDict[bytes, Union[np.ndarray, Tuple[np.ndarray, np.float32]]]" = OrderedDict()
+        self._embedding_cache_size = settings.EMBEDDING_CACHE_SIZE
+        self._embedding_cache_int8 = settings.EMBEDDING_CACHE_INT8
+        # Second cache tier: embeddings already stored in ticket_embeddings, by text_hash
+        self._store_cache_enabled = settings.EMBEDDING_STORE_CACHE_ENABLED
+        # Disk tier: an append-only file of int8 records under EMBEDDING_DISK_CACHE_DIR, so a
+        # restarted process does not re-embed texts it has already seen. Written records are
+        # memory-mapped and found by binary search over their sorted key prefixes; only the
+        # entries waiting for the next flush (at most EMBEDDING_DISK_CACHE_FLUSH_EVERY) are
+        # held in memory.
+        self._disk_pending: Dict[bytes, np.ndarray] = {}
+        self._disk_records = np.empty(0, dtype=_DISK_RECORD)
+        self._disk_prefixes = np.empty(0, dtype=np.uint64)
+        self._disk_order = np.empty(0, dtype=np.intp)
+        self._disk_flush_every = settings.EMBEDDING_DISK_CACHE_FLUSH_EVERY
+        cache_dir = settings.EMBEDDING_DISK_CACHE_DIR
+        self._disk_cache_path = Path(cache_dir) / "cache.bin" if cache_dir else None
+        if self._disk_cache_path is not None:
+            self._load_disk_cache()
+        # Ring of (simhash, cache key) for recent misses, so a retold text with a typo
+        # fix reuses the earlier embedding instead of being embedded again
+        self._simhash_ring: "deque[Tuple[int, bytes]]" = deque(maxlen=settings.EMBEDDING_FUZZY_CACHE_SIZE)
+        self._simhash_max_distance = settings.EMBEDDING_FUZZY_CACHE_MAX_DISTANCE
+
+        # Texts (with cache keys) waiting to be embedded in the next coalesced batch query
+        self._pending: List[Tuple[bytes, str, "asyncio.Future[np.ndarray]"]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set["asyncio.Task[None]"] = set()
+        self._batch_window = settings.EMBEDDING_BATCH_WINDOW_MS / 1000
+        self._batch_max_size = settings.EMBEDDING_BATCH_MAX_SIZE
+
+    @staticmethod
+    def _cache_key(text: str) -> bytes:
+        """Hash the model name and normalized text (NFKC, stripped, lowercased) into a cache key.
+
+        Keys stay fixed-size however long the text is, so the cache's memory is
+        bounded by entry count alone. The hex form is stored as text_hash in
+        ticket_embeddings, which serves as the second cache tier.
+        """
+        normalized = _normalize_text(text)
+        return hashlib.sha256(f"{settings.EMBEDDING_MODEL_NAME}\0{normalized}".encode("utf-8")).digest()
+
+    @staticmethod
+    def _simhash(text: str) -> int:
+        """64-bit simhash of the normalized text's character trigrams.
+
+        Each trigram is hashed with the splitmix64 finalizer and every bit of
+        the result is a majority vote across trigrams, so texts sharing most
+        of their trigrams land a few bits apart. All in numpy, and unlike
+        hash() it is stable across processes.
+        """
+        points = np.frombuffer(_normalize_text(text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(points) < 3:
+            points = np.pad(points, (0, 3 - len(points)))
+        hashes = (points[:-2] << np.uint64(42)) | (points[1:-1] << np.uint64(21)) | points[2:]
+        with np.errstate(over="ignore"):
+            hashes = hashes + np.uint64(0x9E3779B97F4A7C15)
+            hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        hashes ^= hashes >> np.uint64(31)
+        votes = np.unpackbits(hashes.view(np.uint8), bitorder="little").reshape(-1, 64).sum(axis=0)
+        return int(np.packbits(votes * 2 > len(hashes), bitorder="little").view(np.uint64)[0])
+
+    async def generate_embedding(self, text: str) -> np.ndarray:
         """Generate 768-dimensional embedding for text using text-embedding-004 model.
+
+        Results are cached in an in-process LRU keyed by a hash of the normalized text,
+        backed by the embeddings already stored in ticket_embeddings, so repeated
+        texts skip the ML.GENERATE_EMBEDDING job.
         
         Args:
             text: The text to generate embedding for
             
         Returns:
-            List[float]: 768-dimensional embedding vector
+            np.ndarray: 768-dimensional float32 embedding vector (read-only; it is shared with the cache)
             
         Raises:
             Exception: If embedding generation fails
         """
         if not text or not text.strip():
             raise ValueError("Text cannot be empty or None")
-            
-        # Escape text for SQL - handle quotes and newlines
-        escaped_text = text.replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r")
+
+        key = self._cache_key(text)
+        cached = self._cache_get(key)
+        if cached is None:
+            cached = self._fuzzy_cache_get(key, text)
+        if cached is not None:
+            return cached
+
+        embedding = await self._query_embedding(key, text)
+        self._cache_put(key, embedding)
+        return embedding
+
+    async def generate_embeddings_batch(self, texts: List[str], return_exceptions: bool = False,
+                                        fuzzy: bool = True) -> List[Union[np.ndarray, Exception]]:
+        """Generate embeddings for many texts with a single BigQuery ML job.
+
+        Cached texts are served from the LRU or ticket_embeddings; the remaining
+        distinct texts are embedded together in one ML.GENERATE_EMBEDDING query.
         
-        query = f"""
-        SELECT ml_generate_embedding_result AS embedding
-        FROM ML.GENERATE_EMBEDDING(
-            MODEL `{self.project_id}.{self.dataset_id}.embedding_model`,
-            (SELECT '{escaped_text}' AS content),
-            STRUCT(TRUE AS flatten_json_output)
+        Args:
+            texts: Texts to embed
+            return_exceptions: Put a failed row's exception in its slot instead of raising
+            fuzzy: Allow the fuzzy cache to answer with a near-identical text's embedding.
+                   Pass False when the embeddings will be stored.
+            
+        Returns:
+            List: One 768-dimensional float32 vector (read-only) per input text, in order
+            
+        Raises:
+            ValueError: If any text is empty
+            Exception: If embedding generation fails (for any text, unless return_exceptions)
+        """
+        if any(not text or not text.strip() for text in texts):
+            raise ValueError("Text cannot be empty or None")
+
+        keys = [self._cache_key(text) for text in texts]
+        embeddings: Dict[bytes, Union[np.ndarray, Exception]] = {}
+        misses: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in embeddings or key in misses:
+                continue
+            cached = self._cache_get(key)
+            if cached is None and fuzzy:
+                cached = self._fuzzy_cache_get(key, text)
+            if cached is not None:
+                embeddings[key] = cached
+            else:
+                misses[key] = text
+
+        if misses:
+            results = await asyncio.to_thread(self._resolve_texts, list(misses), list(misses.values()))
+            for key, result in zip(misses, results):
+                if isinstance(result, Exception):
+                    if not return_exceptions:
+                        raise result
+                else:
+                    self._cache_put(key, result)
+                embeddings[key] = result
+
+        return [embeddings[key] for key in keys]
+
+    def _cache_get(self, key: bytes) -> Optional[np.ndarray]:
+        """Return a cached embedding and mark it most recently used, or None."""
+        cached = self._embedding_cache.get(key)
+        if cached is None:
+            embedding = self._disk_get(key) if self._disk_cache_path is not None else None
+            if embedding is not None:
+                self._cache_put(key, embedding, persist=False)
+            return embedding
+        self._embedding_cache.move_to_end(key)
+        if isinstance(cached, np.ndarray):
+            return cached
+
+        codes, scale = cached
+        embedding = codes.astype(np.float32) * scale
+        embedding.flags.writeable = False
+        return embedding
+
+    def _fuzzy_cache_get(self, key: bytes, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding of a recent text whose simhash is within
+        EMBEDDING_FUZZY_CACHE_MAX_DISTANCE bits of this one's, or None.
+
+        On a miss the text is remembered in the ring under its own key, which
+        the cache holds once its embedding has been generated. A hit is only
+        returned to the caller, never cached or stored under this text's key:
+        a few bits can be "can" vs "cannot", so a borrowed vector must not
+        outlive the request.
+        """
+        if not self._simhash_ring.maxlen:
+            return None
+        simhash = self._simhash(text)
+        for other, other_key in reversed(self._simhash_ring):
+            if (simhash ^ other).bit_count() <= self._simhash_max_distance:
+                cached = self._cache_get(other_key)
+                if cached is not None:
+                    return cached
+        self._simhash_ring.append((simhash, key))
+        return None
+
+    def _cache_put(self, key: bytes, embedding: np.ndarray, persist: bool = True) -> None:
+        """Cache an embedding, evicting the least recently used entry when full.
+
+        With EMBEDDING_CACHE_INT8 the vector is kept as int8 codes plus a scale:
+        772 bytes instead of 3072, for a cosine error well under 0.1%. With
+        persist (new embeddings) it is also written through to the disk cache.
+        """
+        if self._embedding_cache_int8:
+            codes, scales = quantize_int8(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+            self._embedding_cache[key] = (codes[0], scales[0])
+        else:
+            self._embedding_cache[key] = embedding
+        if len(self._embedding_cache) > self._embedding_cache_size:
+            self._embedding_cache.popitem(last=False)
+
+        if persist and self._disk_cache_path is not None and key not in self._disk_pending:
+            self._disk_pending[key] = embedding
+            if len(self._disk_pending) >= self._disk_flush_every:
+                self.flush_disk_cache()
+
+    def _load_disk_cache(self) -> None:
+        """Memory-map the disk cache file and index its records by key prefix.
+
+        Only the first 8 bytes of each key are read (and argsorted); the
+        records stay in the page cache until looked up, so even a million
+        entries load in a fraction of a second.
+        """
+        self._disk_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self._disk_cache_path.exists():
+            return
+        with open(self._disk_cache_path, "rb") as f:
+            # Every record below the size seen under the shared lock is complete
+            fcntl.flock(f, fcntl.LOCK_SH)
+            count = os.fstat(f.fileno()).st_size // _DISK_RECORD.itemsize
+        self._index_disk_records(count)
+        logger.info("Loaded %d cached embeddings from %s", count, self._disk_cache_path)
+
+    def _index_disk_records(self, count: int) -> None:
+        """Map the first count records of the disk cache file and merge the
+        prefixes of those not yet indexed into the sorted prefix index."""
+        start = len(self._disk_records)
+        if count <= start:
+            return
+        records = np.memmap(self._disk_cache_path, dtype=_DISK_RECORD, mode="r", shape=(count,))
+        prefixes = np.ndarray(
+            (count - start,), dtype="<u8", buffer=records,
+            offset=start * _DISK_RECORD.itemsize, strides=(_DISK_RECORD.itemsize,)
+        )
+        order = np.argsort(prefixes, kind="stable")
+        if start:
+            positions = np.searchsorted(self._disk_prefixes, prefixes[order])
+            self._disk_prefixes = np.insert(self._disk_prefixes, positions, prefixes[order])
+            self._disk_order = np.insert(self._disk_order, positions, order + start)
+        else:
+            self._disk_prefixes = prefixes[order]
+            self._disk_order = order
+        self._disk_records = records
+
+    def _disk_get(self, key: bytes) -> Optional[np.ndarray]:
+        """Return an embedding from the disk cache tier, or None."""
+        embedding = self._disk_pending.get(key)
+        if embedding is not None or not len(self._disk_prefixes):
+            return embedding
+
+        prefix = np.uint64(int.from_bytes(key[:8], "little"))
+        i = int(np.searchsorted(self._disk_prefixes, prefix))
+        while i < len(self._disk_prefixes) and self._disk_prefixes[i] == prefix:
+            record = self._disk_records[self._disk_order[i]]
+            if record["key"].tobytes() == key:
+                embedding = record["codes"].astype(np.float32) * record["scale"]
+                embedding.flags.writeable = False
+                return embedding
+            i += 1
+        return None
+
+    def flush_disk_cache(self) -> None:
+        """Append embeddings cached since the last flush to the disk cache file.
+
+        Each entry is a fixed-size record of cache key, scale and int8 codes
+        (804 bytes). Workers share the file, so appends happen under an
+        exclusive lock, after cutting off any partial record a crashed writer
+        left behind. The new records (and any other worker's) are then served
+        from the memory map. Failures are logged, not raised: the cache is
+        best effort.
+        """
+        if self._disk_cache_path is None or not self._disk_pending:
+            return
+        batch, self._disk_pending = self._disk_pending, {}
+        codes, scales = quantize_int8(np.stack(list(batch.values())).astype(np.float32, copy=False))
+        records = np.empty(len(batch), dtype=_DISK_RECORD)
+        records["key"] = np.frombuffer(b"".join(batch), dtype=_DISK_RECORD["key"])
+        records["scale"] = scales
+        records["codes"] = codes
+        try:
+            with open(self._disk_cache_path, "ab") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                size = os.fstat(f.fileno()).st_size
+                if torn := size % _DISK_RECORD.itemsize:
+                    logger.warning("Truncating partial record at the end of %s", self._disk_cache_path)
+                    f.truncate(size - torn)
+                f.write(records.tobytes())
+                f.flush()
+                count = os.fstat(f.fileno()).st_size // _DISK_RECORD.itemsize
+        except OSError as e:
+            logger.warning("Failed to write embedding cache file %s: %s", self._disk_cache_path, e, exc_info=True)
+            return
+        self._index_disk_records(count)
+
+    async def _query_embedding(self, key: bytes, text: str) -> np.ndarray:
+        """Queue text for the next batched embedding query and await its vector.
+
+        Cache misses arriving within EMBEDDING_BATCH_WINDOW_MS of each other are
+        coalesced into a single ML.GENERATE_EMBEDDING job.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, text, future))
+
+        if len(self._pending) >= self._batch_max_size:
+            self._flush_pending()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._batch_window, self._flush_pending)
+
+        return await future
+
+    def _flush_pending(self) -> None:
+        """Dispatch every queued text as one batched embedding query."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[bytes, str, "asyncio.Future[np.ndarray]"]]) -> None:
+        """Embed a coalesced batch and resolve each waiting caller's future.
+
+        A row that comes back malformed fails only its own caller; the rest of
+        the batch still gets its embeddings.
+        """
+        try:
+            embeddings = await asyncio.to_thread(
+                self._resolve_texts, [key for key, _, _ in batch], [text for _, text, _ in batch]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), embedding in zip(batch, embeddings):
+            if future.done():
+                continue
+            if isinstance(embedding, Exception):
+                future.set_exception(embedding)
+            else:
+                future.set_result(embedding)
+
+    def _resolve_texts(self, keys: List[bytes], texts: List[str]) -> List[Union[np.ndarray, Exception]]:
+        """Look texts up in ticket_embeddings by hash, then embed the rest with BigQuery ML.
+
+        Blocking; call through asyncio.to_thread. Returns one entry per text, as
+        _embed_texts does. Texts sharing a cache key (e.g. the same templated
+        ticket queued by several callers) are looked up and embedded once.
+        """
+        unique = dict(zip(keys, texts))
+        results: Dict[bytes, Union[np.ndarray, Exception]] = dict(self._lookup_stored(list(unique)))
+        missing = [key for key in unique if key not in results]
+        if missing:
+            results.update(zip(missing, self._embed_texts([unique[key] for key in missing])))
+        return [results[key] for key in keys]
+
+    def _lookup_stored(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Fetch embeddings already stored in ticket_embeddings for these cache keys.
+
+        Lookup failures (e.g. a table without the text_hash column) are logged and
+        treated as misses, so generation still goes ahead.
+        """
+        if not self._store_cache_enabled or not keys:
+            return {}
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter("text_hashes", "STRING", [key.hex() for key in keys]),
+            ]
         )
+
+        try:
+            table = self.bigquery_service.query_arrow(self._stored_embeddings_query, job_config)
+            embeddings = self._embeddings_from_arrow(table.column("embedding"))
+            return {
+                bytes.fromhex(text_hash): embedding
+                for text_hash, embedding in zip(table.column("text_hash").to_pylist(), embeddings)
+                if not isinstance(embedding, Exception)
+            }
+        except Exception as e:
+            logger.warning("Stored embedding lookup failed, generating instead: %s", e)
+            return {}
+
+    def _embed_texts(self, texts: List[str]) -> List[Union[np.ndarray, Exception]]:
+        """Run one BigQuery ML embedding query over texts, preserving input order.
+
+        Returns one entry per text: its embedding, or the exception describing
+        why that row's result was unusable. Raises if the query itself fails.
         """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter("texts", "STRING", texts),
+            ],
+            use_query_cache=True
+        )
         
         try:
-            query_job = self.client.query(query)
-            results = list(query_job.result())
+            table = self.bigquery_service.query_arrow(self._embed_query, job_config)
             
-            if not results:
+            if not table.num_rows:
                 raise Exception("No embedding result returned")
-                
-            embedding_result = results[0].embedding
-            
-            # Validate that we got a 768-dimensional vector
-            if not isinstance(embedding_result, list) or len(embedding_result) != 768:
-                raise Exception(f"Expected 768-dimensional vector, got {len(embedding_result) if isinstance(embedding_result, list) else 'non-list'}")
-                
-            return embedding_result
-            
+            if table.num_rows != len(texts):
+                raise Exception(f"Expected {len(texts)} embedding results, got {table.num_rows}")
         except Exception as e:
-            logger.error(f"Failed to generate embedding for text: {str(e)}")
+            logger.error("Failed to generate embedding for text: %s", e, exc_info=True)
             raise Exception(f"Failed to generate embedding: {str(e)}")
 
+        embeddings = self._embeddings_from_arrow(table.column("embedding"))
+        for i, embedding in enumerate(embeddings):
+            if isinstance(embedding, Exception):
+                logger.error("Failed to generate embedding for text: %s", embedding)
+                embeddings[i] = Exception(f"Failed to generate embedding: {str(embedding)}")
+
+        return embeddings
+
+    @classmethod
+    def _embeddings_from_arrow(cls, column: pa.ChunkedArray) -> List[Union[np.ndarray, Exception]]:
+        """Convert an Arrow list<float64> column into one read-only float32 vector per row.
+
+        When every row holds 768 values the whole column is decoded in one
+        vectorized copy; otherwise rows are converted one by one so that a bad
+        row fails only its own caller.
+        """
+        column = column.combine_chunks()
+        lengths = pc.list_value_length(column).fill_null(0).to_numpy(zero_copy_only=False)
+        if len(column) and (lengths == 768).all():
+            matrix = column.flatten().to_numpy(zero_copy_only=False).astype(np.float32).reshape(-1, 768)
+            matrix.flags.writeable = False
+            return list(matrix)
+        return [cls._to_embedding(values) for values in column.to_pylist()]
+
+    @staticmethod
+    def _to_embedding(values: Any) -> Union[np.ndarray, Exception]:
+        """Convert a result row's embedding into a read-only float32 vector.
+
+        Returns (rather than raises) an exception when the row does not hold a
+        768-dimensional vector, so one bad row fails only its own caller.
+        """
+        if not isinstance(values, (list, np.ndarray)):
+            return Exception("Expected 768-dimensional vector, got non-list")
+        embedding = np.asarray(values, dtype=np.float32)
+        if embedding.shape != (768,):
+            return Exception(f"Expected 768-dimensional vector, got {len(embedding)}")
+        embedding.flags.writeable = False
+        return embedding
+
     def prepare_ticket_text(self, ticket: Dict[str, Any]) -> str:
         """Combine ticket fields into formatted text for embedding generation.
         
@@ -86,63 +573,46 @@ class EmbeddingService:
             - Handles missing/null fields gracefully
             - Skips sections if field is None
             - Uses empty string if field is missing from dict
+            - Uses the ticket_ form of a field when a ticket has both forms
         """
-        # Handle different possible field names (with/without ticket_ prefix)
-        subject = self._get_field_value(ticket, ['subject', 'ticket_subject'])
-        description = self._get_field_value(ticket, ['description', 'ticket_description'])  
-        resolution = self._get_field_value(ticket, ['resolution', 'ticket_resolution'])
-        
-        # Build formatted text, skipping None fields
         text_parts = []
-        
-        if subject is not None:
-            text_parts.append(f"Subject: {subject}")
-            
-        if description is not None:
-            text_parts.append(f"Issue: {description}")
-            
-        if resolution is not None:
-            text_parts.append(f"Resolution: {resolution}")
+        for name, column, prefix in _TICKET_FIELDS:
+            # Direct lookups: the ticket_ column (as BigQuery rows name it), else the plain name
+            value = ticket.get(column) or ticket.get(name)
+            if value is None:
+                continue
+            # str() only for non-strings (calling it on a str still costs a type call);
+            # skip fields that are blank once stripped
+            if value := (value if type(value) is str else str(value)).strip():
+                text_parts.append(prefix + value)
         
         # Join with newlines, return empty string if no valid parts
-        return "\n".join(text_parts) if text_parts else ""
+        return "\n".join(text_parts)
 
-    def _get_field_value(self, ticket: Dict[str, Any], field_names: List[str]) -> Optional[str]:
-        """Get field value from ticket dict, trying multiple possible field names.
-        
-        Args:
-            ticket: Ticket dictionary
-            field_names: List of possible field names to try
-            
-        Returns:
-            Optional[str]: Field value or None if not found/null
-        """
-        for field_name in field_names:
-            if field_name in ticket:
-                value = ticket[field_name]
-                # Return None for None values, empty string for empty strings
-                if value is None:
-                    return None
-                # Convert to string and strip whitespace
-                str_value = str(value).strip()
-                # Return None for empty strings after stripping
-                return str_value if str_value else None
-        
-        # Field not found in ticket dict - return None to skip this section
-        return None
-
-    async def generate_ticket_embedding(self, ticket: Dict[str, Any]) -> List[float]:
+    async def generate_ticket_embedding(self,
+                                        ticket: Union[Dict[str, Any], List[Dict[str, Any]]]
+                                        ) -> Union[np.ndarray, List[np.ndarray]]:
         """Generate embedding for a ticket by combining its text fields.
         
+        Given a list of tickets, embeds them all with one generate_embeddings_batch
+        call (a single BigQuery ML query for the uncached texts).
+        
         Args:
-            ticket: Dictionary containing ticket information
+            ticket: Dictionary containing ticket information, or a list of them
             
         Returns:
-            List[float]: 768-dimensional embedding vector
+            np.ndarray: 768-dimensional float32 embedding vector, or a list of
+            them in ticket order
             
         Raises:
             Exception: If embedding generation fails or no valid text found
         """
+        if isinstance(ticket, list):
+            ticket_texts = [self.prepare_ticket_text(t) for t in ticket]
+            if not all(ticket_texts):
+                raise ValueError("No valid text found in ticket to generate embedding")
+            return await self.generate_embeddings_batch(ticket_texts)
+
         ticket_text = self.prepare_ticket_text(ticket)
         
         if not ticket_text:
@@ -150,6 +620,183 @@ class EmbeddingService:
             
         return await self.generate_embedding(ticket_text)
 
+    async def embed_tickets_stream(self,
+                                   tickets: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+                                   batch_size: int = 32,
+                                   concurrency: int = 8,
+                                   *,
+                                   prepare: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+                                   queue_size: Optional[int] = None
+                                   ) -> AsyncIterator[Tuple[Dict[str, Any], str, np.ndarray]]:
+        """Embed tickets as they arrive, yielding (ticket, text, embedding) as each batch completes.
+
+        A prepare stage (ticket -> text) feeds concurrency embed workers, which
+        each drain up to batch_size texts into one generate_embeddings_batch
+        call. Both hand-offs are bounded queues, so a slow consumer stalls the
+        workers and the workers stall the ticket source: memory stays at a few
+        batches of vectors however many tickets flow through.
+
+        Args:
+            tickets: Tickets to embed, from a plain or an async iterable
+            batch_size: Maximum texts per embedding job
+            concurrency: Concurrent embedding jobs
+            prepare: Builds a ticket's text; defaults to prepare_ticket_text.
+                     Tickets for which it returns no text are skipped.
+            queue_size: Capacity of each inter-stage queue (default 2 * concurrency)
+
+        Yields:
+            (ticket, text, embedding) for every ticket embedded; tickets whose
+            embedding fails are logged and skipped
+        """
+        prepare = prepare or self.prepare_ticket_text
+        queue_size = queue_size or 2 * concurrency
+        prepared: "asyncio.Queue[Optional[Tuple[Dict[str, Any], str]]]" = asyncio.Queue(queue_size)
+        embedded: "asyncio.Queue[Optional[Tuple[Dict[str, Any], str, np.ndarray]]]" = asyncio.Queue(queue_size)
+        failure: Optional[Exception] = None
+
+        async def put_prepared(ticket: Dict[str, Any]) -> None:
+            text = prepare(ticket)
+            if text and text.strip():
+                await prepared.put((ticket, text))
+
+        async def prepare_stage() -> None:
+            nonlocal failure
+            try:
+                if isinstance(tickets, AsyncIterable):
+                    async for ticket in tickets:
+                        await put_prepared(ticket)
+                else:
+                    for ticket in tickets:
+                        await put_prepared(ticket)
+            except Exception as e:
+                # Still close the stage so the workers, and the caller, finish
+                failure = e
+            for _ in range(concurrency):
+                await prepared.put(None)
+
+        async def embed_stage() -> None:
+            done = False
+            while not done:
+                batch, done = await self._next_batch(prepared, batch_size)
+                if not batch:
+                    continue
+                try:
+                    # Exact embeddings only: these are stored under each text's hash and indexed
+                    embeddings = await self.generate_embeddings_batch(
+                        [text for _, text in batch], return_exceptions=True, fuzzy=False
+                    )
+                except Exception as e:
+                    logger.error("Failed to embed batch of %d tickets: %s", len(batch), e, exc_info=True)
+                    continue
+                for (ticket, text), embedding in zip(batch, embeddings):
+                    if isinstance(embedding, Exception):
+                        logger.error("Failed to embed ticket %s: %s", ticket.get('ticket_id'), embedding)
+                    else:
+                        await embedded.put((ticket, text, embedding))
+
+        async def embed_then_close() -> None:
+            await asyncio.gather(*(embed_stage() for _ in range(concurrency)))
+            await embedded.put(None)
+
+        tasks = [asyncio.ensure_future(prepare_stage()), asyncio.ensure_future(embed_then_close())]
+        try:
+            while (item := await embedded.get()) is not None:
+                yield item
+            await asyncio.gather(*tasks)
+            if failure is not None:
+                raise failure
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ingest_tickets(self,
+                             tickets: Iterable[Dict[str, Any]],
+                             embed_batch: int = 64,
+                             upsert_batch: int = 500,
+                             *,
+                             prepare: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+                             embed_workers: int = 2,
+                             upsert_workers: int = 2,
+                             queue_size: int = 32) -> int:
+        """Embed and store tickets through a bounded, pipelined set of stages.
+
+        embed_tickets_stream prepares and embeds the tickets; its output feeds
+        upsert workers, which each write up to upsert_batch rows with one MERGE.
+        Bounded queues between the stages apply backpressure, so BigQuery ML
+        jobs, writes and text preparation overlap without buffering everything.
+
+        Args:
+            tickets: Tickets to ingest (must carry ticket_id)
+            embed_batch: Maximum texts per embedding job
+            upsert_batch: Maximum rows per MERGE
+            prepare: Builds a ticket's text; defaults to prepare_ticket_text.
+                     Tickets for which it returns no text are skipped.
+            embed_workers: Concurrent embedding jobs
+            upsert_workers: Concurrent upserts
+            queue_size: Capacity of each inter-stage queue
+
+        Returns:
+            int: Number of tickets embedded and stored
+        """
+        embedded: "asyncio.Queue[Optional[Tuple[Dict[str, Any], str, np.ndarray]]]" = asyncio.Queue(queue_size)
+        stored = 0
+
+        async def embed_stage() -> None:
+            async for item in self.embed_tickets_stream(
+                tickets, embed_batch, embed_workers, prepare=prepare, queue_size=queue_size
+            ):
+                await embedded.put(item)
+            for _ in range(upsert_workers):
+                await embedded.put(None)
+
+        async def upsert_stage() -> None:
+            nonlocal stored
+            done = False
+            while not done:
+                batch, done = await self._next_batch(embedded, upsert_batch)
+                if not batch:
+                    continue
+                try:
+                    await self.store_embeddings_bulk([
+                        (ticket["ticket_id"], embedding, ticket.get("ticket_resolution") or ticket.get("resolution") or "", text)
+                        for ticket, text, embedding in batch
+                    ])
+                    stored += len(batch)
+                except Exception as e:
+                    logger.error("Failed to store embeddings for a batch of %d tickets: %s", len(batch), e, exc_info=True)
+
+        tasks = [
+            asyncio.ensure_future(embed_stage()),
+            *(asyncio.ensure_future(upsert_stage()) for _ in range(upsert_workers)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return stored
+
+    @staticmethod
+    async def _next_batch(queue: "asyncio.Queue", max_items: int) -> Tuple[List[Any], bool]:
+        """Wait for one item, then take whatever else is queued, up to max_items.
+
+        Returns:
+            (items, done): done is True once the stage's None sentinel was taken
+        """
+        item = await queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        while len(batch) < max_items:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
     async def test_connection(self) -> Dict[str, str]:
         """Test the BigQuery connection and embedding model availability.
         
@@ -182,82 +829,135 @@ class EmbeddingService:
             }
         
 
-    async def store_embedding(self, ticket_id: int, vector: List[float], ticket_resolution: str, *, upsert: bool = True) -> Dict[str, str]:
+    async def store_embedding(self, ticket_id: int, vector: Union[List[float], np.ndarray], ticket_resolution: str, *, upsert: bool = True, text: Optional[str] = None) -> Dict[str, str]:
         """
         Store an embedding for a resolved ticket in BigQuery.
 
-        Table schema (ticket_embeddings):
+        Table schema (ticket_embeddings, see setup_embeddings.py):
           - ticket_id INT64
           - embedding_vector ARRAY<FLOAT64>   # 768-dim from text-embedding-004
           - ticket_resolution STRING                # resolution text for the most similar found ticket
+          - text_hash STRING                  # hex cache key of the embedded text (clustering column)
 
         Args:
             ticket_id: Ticket identifier.
-            vector: 768-d embedding vector.
+            vector: 768-d embedding vector, as a list or a float32 ndarray.
             ticket_resolution: The resolution text for this ticket.
             upsert: If True, MERGE on ticket_id; otherwise plain INSERT.
+            text: The text that was embedded; its hash lets later requests reuse the vector.
 
         Returns:
             Dict with status/message.
         """
-        # Validation
-        if not isinstance(ticket_id, int):
-            raise ValueError("ticket_id must be an int")
-        if not isinstance(vector, list) or not all(isinstance(x, (int, float)) for x in vector):
-            raise ValueError("vector must be a List[float]")
-        if len(vector) != 768:
-            raise ValueError(f"Expected 768-dim vector, got {len(vector)}")
-        if ticket_resolution is None:
-            resolution = ""
-
-        table_fqn = f"`{self.project_id}.embeddings.ticket_embeddings`"
-
-        if upsert:
-            # Idempotent write: update existing row for ticket_id or insert new
-            query = f"""
-            MERGE {table_fqn} T
-            USING (
-              SELECT
-                @ticket_id        AS ticket_id,
-                @embedding        AS embedding_vector,
-                @ticket_resolution       AS ticket_resolution
-            ) S
-            ON T.ticket_id = S.ticket_id
-            WHEN MATCHED THEN
-              UPDATE SET
-                embedding_vector = S.embedding_vector,
-                ticket_resolution       = S.ticket_resolution
-            WHEN NOT MATCHED THEN
-              INSERT (ticket_id, embedding_vector, ticket_resolution)
-              VALUES (S.ticket_id, S.embedding_vector, S.ticket_resolution);
-            """
-        else:
-            # Insert only (will error if duplicate ticket_id and a uniqueness rule exists externally)
-            query = f"""
-            INSERT INTO {table_fqn} (ticket_id, embedding_vector, ticket_resolution)
-            VALUES (@ticket_id, @embedding, @resolution);
-            """
+        return await self.store_embeddings_bulk(
+            [(ticket_id, vector, ticket_resolution, text)],
+            upsert=upsert
+        )
+
+    async def store_embeddings_bulk(self,
+                                    rows: List[Tuple[int, Union[List[float], np.ndarray], Optional[str], Optional[str]]],
+                                    *,
+                                    upsert: bool = True) -> Dict[str, str]:
+        """
+        Store many ticket embeddings with a single DML statement.
+
+        The rows are sent as one ARRAY<STRUCT> query parameter and written by one
+        MERGE (or INSERT) over UNNEST(@rows), so the per-statement DML overhead is
+        paid once per call rather than once per ticket.
+
+        Args:
+            rows: (ticket_id, vector, ticket_resolution, text) tuples; text may be None.
+                  If a ticket_id repeats, its last row wins.
+            upsert: If True, MERGE on ticket_id; otherwise plain INSERT.
+
+        Returns:
+            Dict with status/message.
+        """
+        # Validation; MERGE rejects several source rows for one target row, so keep the last
+        validated: Dict[int, Tuple[np.ndarray, str, Optional[str]]] = {}
+        for ticket_id, vector, ticket_resolution, text in rows:
+            if not isinstance(ticket_id, int):
+                raise ValueError("ticket_id must be an int")
+            validated[ticket_id] = (
+                self._validate_vector(vector),
+                ticket_resolution or "",
+                self._cache_key(text).hex() if text else None,
+            )
+        if not validated:
+            return {"status": "success", "message": "No embeddings to store"}
+
+        query = self._merge_embeddings_query if upsert else self._insert_embeddings_query
+        codes, scales = quantize_int8(np.stack([vector for vector, _, _ in validated.values()]))
 
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
-                bigquery.ScalarQueryParameter("ticket_id", "INT64", ticket_id),
-                bigquery.ArrayQueryParameter("embedding", "FLOAT64", vector),
-                bigquery.ScalarQueryParameter("ticket_resolution", "STRING", ticket_resolution),
+                bigquery.ArrayQueryParameter("rows", "STRUCT", [
+                    bigquery.StructQueryParameter(
+                        None,
+                        bigquery.ScalarQueryParameter("ticket_id", "INT64", ticket_id),
+                        bigquery.ArrayQueryParameter("embedding_vector", "FLOAT64", vector.tolist()),
+                        bigquery.ScalarQueryParameter("embedding_int8", "BYTES", code.tobytes()),
+                        bigquery.ScalarQueryParameter("embedding_scale", "FLOAT64", float(scale)),
+                        bigquery.ScalarQueryParameter("ticket_resolution", "STRING", ticket_resolution),
+                        bigquery.ScalarQueryParameter("text_hash", "STRING", text_hash),
+                    )
+                    for (ticket_id, (vector, ticket_resolution, text_hash)), code, scale
+                    in zip(validated.items(), codes, scales)
+                ]),
             ]
         )
 
         try:
-            job = self.client.query(query, job_config=job_config)
-            result = job.result()  # wait for completion
+            job = await asyncio.to_thread(self._run_dml, query, job_config)
             affected = getattr(job, "num_dml_affected_rows", None)
+            if settings.VECTOR_INDEX_ENABLED:
+                # Normalizing, and an HNSW insert once the graph exists, are real CPU work;
+                # keep them (and the index lock) off the event loop
+                await asyncio.to_thread(
+                    vector_index.add,
+                    list(validated),
+                    [vector for vector, _, _ in validated.values()],
+                    [ticket_resolution for _, ticket_resolution, _ in validated.values()]
+                )
             return {
                 "status": "success",
                 "message": f"Embedding stored (affected_rows={affected})" if affected is not None else "Embedding stored"
             }
         except Exception as e:
-            logger.error(f"Failed to store embedding for ticket_id {ticket_id}: {e}")
+            logger.error("Failed to store embeddings for ticket_ids %s: %s", list(validated), e, exc_info=True)
             raise
 
+    @staticmethod
+    def _validate_vector(vector: Union[List[float], np.ndarray]) -> np.ndarray:
+        """Check a 768-d embedding and return an L2-normalized float64 copy.
+
+        Stored vectors are unit length, so cosine distance over them reduces to a
+        dot product and scores never depend on the embedding's magnitude.
+        """
+        if not isinstance(vector, (list, np.ndarray)):
+            raise ValueError("vector must be a List[float] or an ndarray")
+        try:
+            vec = np.array(vector, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError("vector must be a List[float]")
+        if vec.ndim != 1:
+            raise ValueError("vector must be one-dimensional")
+        if vec.shape != (768,):
+            raise ValueError(f"Expected 768-dim vector, got {len(vec)}")
+
+        norm = np.linalg.norm(vec)
+        if not np.isfinite(norm) or norm == 0:
+            raise ValueError("vector must be finite and non-zero")
+        vec /= norm
+        assert abs(np.linalg.norm(vec) - 1) < 1e-5
+        return vec
+
+    def _run_dml(self, query: str, job_config: bigquery.QueryJobConfig) -> bigquery.QueryJob:
+        """Run a DML statement and block until it completes (call via asyncio.to_thread)."""
+        job = self.client.query(query, job_config=job_config)
+        job.result()  # wait for completion
+        return job
+
 
 # Create a default instance
 embedding_service = EmbeddingService()
@@ -0,0 +1,57 @@
+"""
+PCAProjection class for reducing ticket embeddings before in-process similarity search.
+"""
+
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+class PCAProjection:
+    """Linear projection of embeddings onto their top principal components.
+
+    The projection is fitted and applied without mean-centering: centering
+    shifts the origin, which changes the angle between two vectors and so their
+    cosine scores. Uncentered axes span the subspace the embeddings actually
+    occupy, so cosine similarity within that subspace is preserved.
+    """
+
+    def __init__(self, components: np.ndarray):
+        """Initialize from a fitted component matrix.
+
+        Args:
+            components: Principal axes as rows, shape (n_components, dim)
+        """
+        self.components = np.asarray(components, dtype=np.float32)
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, n_components: int) -> "PCAProjection":
+        """Fit a projection onto the top n_components singular axes of vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if n_components > min(vectors.shape):
+            raise ValueError(f"n_components must be <= {min(vectors.shape)}, got {n_components}")
+
+        _, _, vt = np.linalg.svd(vectors, full_matrices=False)
+        return cls(vt[:n_components])
+
+    @classmethod
+    def load(cls, path: str) -> Optional["PCAProjection"]:
+        """Load a projection saved with save(), or None if the file does not exist."""
+        if not Path(path).is_file():
+            return None
+        with np.load(path) as data:
+            return cls(data["components"])
+
+    def save(self, path: str) -> None:
+        """Save the projection as an .npz archive."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, components=self.components)
+
+    def transform(self, vectors: np.ndarray) -> np.ndarray:
+        """Project vectors (one per row) into the reduced space."""
+        return np.asarray(vectors, dtype=np.float32) @ self.components.T
@@ -1,37 +1,124 @@
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from google.cloud import bigquery
 from app.core.config import settings
-from app.services.bigquery_service import BigQueryService
-from app.services.embedding_service import EmbeddingService
+from app.services.bigquery_service import bigquery_service
+from app.services.embedding_service import embedding_service
+from app.services.vector_index import EMBEDDING_DIMENSION, vector_index
+import asyncio
 import logging
+import time
+import numpy as np
+import pyarrow as pa
 
 logger = logging.getLogger(__name__)
 
+# SQL templates, formatted with the embeddings table once per service in __init__.
+# The index load reads the int8 copy of each embedding: 768 bytes per row instead
+# of 6 KB for ARRAY<FLOAT64>, and the index quantizes to int8 anyway.
+LOAD_INDEX_QUERY = """
+SELECT ticket_id, embedding_int8, embedding_scale, ticket_resolution
+FROM `{table}`
+WHERE embedding_int8 IS NOT NULL
+"""
+
+# Served by the ticket_embeddings_idx vector index (setup_embeddings.py) once the
+# table is large enough for BigQuery to use it; brute force before that
+SEARCH_QUERY = """
+SELECT
+  base.ticket_id AS ticket_id,
+  base.ticket_resolution AS ticket_resolution,
+  1 - distance AS similarity_score
+FROM VECTOR_SEARCH(
+  TABLE `{table}`,
+  'embedding_vector',
+  (SELECT @query_embedding AS embedding_vector),
+  top_k => @limit,
+  distance_type => 'COSINE'
+)
+WHERE distance <= 0.5  -- similarity_score >= 0.5, as a plain range filter on distance
+ORDER BY distance
+"""
+
 
 class RetrievalService:
   """Service for semantic retrieval over ticket embeddings using BigQuery."""
 
   def __init__(self):
     """Initialize RetrievalService with BigQuery connection and embedding generator."""
-    self.bigquery_service = BigQueryService(
-      dataset_id=settings.BIGQUERY_DATASET_ID,
-      table_id=settings.BIGQUERY_TABLE_ID,  # parity with EmbeddingService
-    )
-    self.client = self.bigquery_service.client
+    # Reuse the process-wide services, and with them one BigQuery client and connection pool
+    self.bigquery_service = bigquery_service
+    self.embedding_service = embedding_service
+    self.client = embedding_service.client
     self.project_id = settings.GOOGLE_CLOUD_PROJECT
     self.dataset_id = settings.BIGQUERY_DATASET_ID
 
-    # Reuse the embedding service to embed queries
-    self.embedding_service = EmbeddingService()
+    embeddings_table = f"{self.project_id}.embeddings.{settings.EMBEDDING_TABLE_NAME}"
+    self._load_index_query = LOAD_INDEX_QUERY.format(table=embeddings_table)
+    self._search_query = SEARCH_QUERY.format(table=embeddings_table)
+
+    # Semantic cache of recent searches, keyed by the sign bits (SimHash) of the query
+    # embedding: (unit query embedding, limit, results, stored_at). _search_cache_get and
+    # _search_cache_put never await, so concurrent searches cannot interleave inside a
+    # lookup or an eviction. Cached result lists are returned to every matching caller.
+    self._search_cache: "OrderedDict[bytes, Tuple[np.ndarray, int, List[Dict[str, Any]], float]]" = OrderedDict()
+
+  async def load_index(self) -> int:
+    """
+    Load every stored embedding from BigQuery into the in-process vector index.
+    Until this completes, search_similar_tickets falls back to BigQuery.
+
+    Returns:
+      int: Number of embeddings indexed
+    """
+    return await asyncio.to_thread(self._load_index_sync)
+
+  def _load_index_sync(self) -> int:
+    """Blocking half of load_index: stream embeddings as Arrow and build the index."""
+    # Record embeddings stored while the snapshot downloads, not just while it builds
+    vector_index.begin_load()
+    try:
+      table = self.bigquery_service.query_arrow(self._load_index_query)
+
+      ticket_ids = table.column("ticket_id").to_pylist()
+      codes = table.column("embedding_int8").combine_chunks().cast(pa.binary(EMBEDDING_DIMENSION))
+      vectors = np.frombuffer(
+        codes.buffers()[1], dtype=np.int8,
+        count=len(codes) * EMBEDDING_DIMENSION, offset=codes.offset * EMBEDDING_DIMENSION
+      ).reshape(-1, EMBEDDING_DIMENSION).astype(np.float32)
+      vectors *= table.column("embedding_scale").to_numpy().astype(np.float32)[:, None]
+      resolutions = [r or "" for r in table.column("ticket_resolution").to_pylist()]
+    except Exception:
+      vector_index.cancel_load()
+      raise
+
+    vector_index.load(ticket_ids, vectors, resolutions)
+    return len(ticket_ids)
+
+  def _search_index(self, query_embedding: np.ndarray, limit: int) -> List[Dict[str, Any]]:
+    """Nearest-neighbour search against the in-process vector index."""
+    results: List[Dict[str, Any]] = []
+    for ticket_id, resolution, distance in vector_index.search(query_embedding, limit):
+      # Cosine distance, the same metric VECTOR_SEARCH reports on the SQL path
+      similarity = 1 - distance
+      if similarity < 0.5:
+        continue
+      results.append({
+        "ticket_id": ticket_id,
+        "ticket_resolution": resolution,
+        "similarity_score": similarity,
+      })
+    return results
 
   async def search_similar_tickets(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
     """
-    Perform vector similarity search over tickets using BigQuery and ML.DISTANCE.
+    Perform vector similarity search over tickets using the in-process vector index,
+    or BigQuery VECTOR_SEARCH while the index is still loading.
 
     Steps:
       1) Generate embedding for the input query (768-dim).
-      2) Execute the EXACT SQL pattern (distance ascending).
-      3) Convert distance -> similarity: similarity = 1 - (distance / 2).
+      2) Find the `limit` nearest embeddings by cosine distance.
+      3) Convert distance -> similarity: similarity = 1 - distance.
       4) Filter out similarity < 0.5.
       5) Return results (sorted by similarity DESC). Empty list if none.
     """
@@ -41,55 +128,71 @@ class RetrievalService:
       return []  # defensive guard
 
     try:
-      # Generate query embedding
-      query_embedding: List[float] = await self.embedding_service.generate_embedding(query)
-
-      embeddings_table = f"`{self.project_id}.embeddings.ticket_embeddings`"
-
-      sql = f"""
-      WITH distances AS (
-        SELECT
-          e.ticket_id,
-          e.ticket_resolution,
-          ML.DISTANCE(e.embedding_vector, @query_embedding) AS distance
-        FROM {embeddings_table} e
-      )
-      SELECT
-        ticket_id,
-        ticket_resolution,
-        1 - (distance / 2) AS similarity_score
-      FROM distances
-      WHERE 1 - (distance / 2) >= 0.5
-      ORDER BY similarity_score DESC
-      LIMIT @limit
-      """
+      # Generate query embedding, unit-normalized like the stored vectors
+      query_embedding = await self.embedding_service.generate_embedding(query)
+      query_embedding = query_embedding / max(np.linalg.norm(query_embedding), 1e-12)
+
+      cached = self._search_cache_get(query_embedding, limit)
+      if cached is not None:
+        return cached
+
+      if vector_index.ready:
+        results = self._search_index(query_embedding, limit)
+        self._search_cache_put(query_embedding, limit, results)
+        return results
 
       job_config = bigquery.QueryJobConfig(
         query_parameters=[
-          bigquery.ArrayQueryParameter("query_embedding", "FLOAT64", query_embedding),
+          bigquery.ArrayQueryParameter("query_embedding", "FLOAT64", query_embedding.tolist()),
           bigquery.ScalarQueryParameter("limit", "INT64", limit),
-        ]
+        ],
+        use_query_cache=True
       )
 
-      query_job = self.client.query(sql, job_config=job_config)
-      rows = list(query_job.result())
-      
-      if not rows:
-        return []
-
-      results: List[Dict[str, Any]] = []
-      for r in rows:
-        results.append({
-          "ticket_id": r.ticket_id,
-          "ticket_resolution": r.ticket_resolution,
-          "similarity_score": float(r.similarity_score),
-        })
-
+      # Decode the result columns once as Arrow rather than row by row over REST
+      table = await asyncio.to_thread(self.bigquery_service.query_arrow, self._search_query, job_config)
+      results = table.select(["ticket_id", "ticket_resolution", "similarity_score"]).to_pylist()
+      self._search_cache_put(query_embedding, limit, results)
       return results
     except Exception as e:
-      logger.error(f"Retrieval search failed for query='{query[:60]}...': {e}")
+      logger.error("Retrieval search failed for query='%.60s...': %s", query, e, exc_info=True)
       return []  # graceful empty
 
+  def _search_cache_get(self, query_embedding: np.ndarray, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """Return cached results for a query embedding within SEARCH_CACHE_MIN_SIMILARITY of an earlier one.
+
+    The cache holds at most SEARCH_CACHE_SIZE entries, so every live entry is
+    compared in one matrix-vector product rather than only those sharing a hash
+    bucket: near-identical questions often differ in a few sign bits.
+    """
+    now = time.monotonic()
+    for key in [k for k, entry in self._search_cache.items() if now - entry[3] > settings.SEARCH_CACHE_TTL_SECONDS]:
+      del self._search_cache[key]
+    if not self._search_cache:
+      return None
+
+    keys = list(self._search_cache)
+    entries = list(self._search_cache.values())
+    scores = np.stack([entry[0] for entry in entries]) @ query_embedding
+    for i in np.argsort(-scores):
+      if scores[i] < settings.SEARCH_CACHE_MIN_SIMILARITY:
+        break
+      _, cached_limit, results, _ = entries[i]
+      if cached_limit >= limit:
+        self._search_cache.move_to_end(keys[i])
+        return results[:limit]
+    return None
+
+  def _search_cache_put(self, query_embedding: np.ndarray, limit: int, results: List[Dict[str, Any]]) -> None:
+    """Cache search results, evicting the least recently used entry when full."""
+    if settings.SEARCH_CACHE_SIZE <= 0:
+      return
+    key = np.packbits(query_embedding > 0).tobytes()
+    self._search_cache[key] = (query_embedding, limit, results, time.monotonic())
+    self._search_cache.move_to_end(key)
+    while len(self._search_cache) > settings.SEARCH_CACHE_SIZE:
+      self._search_cache.popitem(last=False)
+
   def format_rag_context(self, tickets: List[Dict[str, Any]]) -> str:
     """
     Format retrieved tickets into a RAG-ready context string.
@@ -107,21 +210,16 @@ class RetrievalService:
     if not tickets:
       return ""
 
-    lines: List[str] = ["Similar Cases:"]
-    for t in tickets:
-      subject = t.get("ticket_subject") or ""
-      description = t.get("ticket_description") or ""
-      resolution = t.get("ticket_resolution") or ""
-
-      lines.append(f"Case #{t.get('ticket_id')}: {subject}")
-      lines.append(f"Issue: {description}")
-      lines.append(f"Resolution: {resolution}")
-      lines.append("---")
-
-    out = "\n".join(lines)
-    if out.endswith("\n---"):
-      out = out[:-4]
-    return out
+    return "Similar Cases:\n" + "\n---\n".join(self._rag_block(t) for t in tickets)
+
+  @staticmethod
+  def _rag_block(ticket: Dict[str, Any]) -> str:
+    """Build one ticket's RAG block from its subject, description and resolution."""
+    return (
+      f"Case #{ticket.get('ticket_id')}: {ticket.get('ticket_subject') or ''}\n"
+      f"Issue: {ticket.get('ticket_description') or ''}\n"
+      f"Resolution: {ticket.get('ticket_resolution') or ''}"
+    )
 
 
 # Create a default instance
@@ -0,0 +1,349 @@
+"""
+VectorIndex class for in-process nearest-neighbour search over ticket embeddings.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+
+import hnswlib
+import numpy as np
+
+from app.core.config import settings
+from app.services.pca import PCAProjection
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 768
+
+# Rows dequantized per step when scoring an int8 matrix; bounds the float32 scratch space
+_SCORE_BLOCK_ROWS = 4096
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization.
+
+    Args:
+        vectors: 2-D float array, one vector per row
+
+    Returns:
+        (int8 codes, float32 per-row scales) such that codes * scale ~= vectors
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class _IndexState:
+    """Vectors held by a VectorIndex: a contiguous embedding matrix for exact
+    search, replaced by an HNSW graph once the index grows past exact_search_max.
+
+    With quantize=True the matrix holds int8 codes and a per-row scale instead of
+    float32 values: for 768-d embeddings that is 772 bytes per row instead of
+    3072 (20k rows: ~15 MB instead of ~61 MB). The HNSW graph keeps float32
+    vectors plus its links (~3.2 KB per row at M=16), so the matrix is freed
+    when the graph takes over.
+
+    The graph is built from the matrix off the lock (see VectorIndex.add); rows
+    added meanwhile go to the matrix and to build_log, and are replayed onto
+    the graph when it is installed.
+    """
+
+    def __init__(self, dim: int, capacity: int, ef: int, M: int, ef_construction: int,
+                 exact_search_max: int, quantize: bool):
+        self.ef = ef
+        self.M = M
+        self.ef_construction = ef_construction
+        self.exact_search_max = exact_search_max
+        self.hnsw: Optional[hnswlib.Index] = None
+        # (ticket_ids, vectors) added while a graph build is running; None when none is
+        self.build_log: Optional[List[Tuple[List[int], np.ndarray]]] = None
+
+        # Unit-normalized rows, grown by doubling; only the first `count` rows are live
+        self.quantize = quantize
+        self.matrix = np.empty((capacity, dim), dtype=np.int8 if quantize else np.float32)
+        self.scales = np.ones(capacity, dtype=np.float32)
+        self.count = 0
+        self.rows: Dict[int, int] = {}
+        self.ticket_ids: List[int] = []
+        self.resolutions: Dict[int, str] = {}
+
+    def add(self, ticket_ids: Sequence[int], vectors: np.ndarray, ticket_resolutions: Sequence[str]) -> None:
+        """Upsert unit-normalized vectors into the matrix (and the graph, if built)."""
+        new_ids = [ticket_id for ticket_id in dict.fromkeys(ticket_ids) if ticket_id not in self.rows]
+        live = self.count
+        needed = live + len(new_ids)
+
+        for ticket_id in new_ids:
+            self.rows[ticket_id] = self.count
+            self.ticket_ids.append(ticket_id)
+            self.count += 1
+        self.resolutions.update(zip(ticket_ids, ticket_resolutions))
+
+        if self.hnsw is not None:
+            self._add_to_hnsw(ticket_ids, vectors)
+            return
+        if self.build_log is not None:
+            self.build_log.append((list(ticket_ids), vectors))
+
+        if needed > len(self.matrix):
+            capacity = max(needed, 2 * len(self.matrix))
+            grown = np.empty((capacity, self.matrix.shape[1]), dtype=self.matrix.dtype)
+            grown[:live] = self.matrix[:live]
+            self.matrix = grown
+            self.scales = np.resize(self.scales, capacity)
+
+        rows = [self.rows[ticket_id] for ticket_id in ticket_ids]
+        if self.quantize:
+            self.matrix[rows], self.scales[rows] = quantize_int8(vectors)
+        else:
+            self.matrix[rows] = vectors
+
+    def _add_to_hnsw(self, ticket_ids: Sequence[int], vectors: np.ndarray) -> None:
+        """Upsert vectors into the graph, growing it as needed."""
+        if self.count > self.hnsw.get_max_elements():
+            self.hnsw.resize_index(max(self.count, 2 * self.hnsw.get_max_elements()))
+        # hnswlib updates the stored vector in place when a label already exists
+        self.hnsw.add_items(vectors, np.asarray(ticket_ids, dtype=np.int64))
+
+    def needs_hnsw(self) -> bool:
+        """Whether the matrix has outgrown exact search and no graph is built or building."""
+        return self.hnsw is None and self.build_log is None and self.count > self.exact_search_max
+
+    def start_hnsw_build(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Begin logging adds and return the (matrix, scales, labels) to build from.
+
+        Call under the index lock. Rows later updated in place may be read
+        half-written by the build; the log replays them, so the graph ends up
+        with their final vectors.
+        """
+        self.build_log = []
+        count = self.count
+        return self.matrix[:count], self.scales[:count], np.asarray(self.ticket_ids, dtype=np.int64)
+
+    def build_hnsw(self, matrix: np.ndarray, scales: np.ndarray, labels: np.ndarray) -> hnswlib.Index:
+        """Build an HNSW graph over the given rows; needs no lock."""
+        hnsw = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        hnsw.init_index(max_elements=max(2 * len(labels), 1024), ef_construction=self.ef_construction, M=self.M)
+        hnsw.set_ef(self.ef)
+
+        for start in range(0, len(labels), _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, len(labels))
+            block = matrix[start:end].astype(np.float32)
+            if self.quantize:
+                block *= scales[start:end, None]
+            hnsw.add_items(block, labels[start:end])
+        return hnsw
+
+    def install_hnsw(self, hnsw: hnswlib.Index) -> None:
+        """Replay the adds logged during the build onto the graph and switch to it.
+
+        Call under the index lock.
+        """
+        log, self.build_log = self.build_log or [], None
+        self.hnsw = hnsw
+        for ticket_ids, vectors in log:
+            self._add_to_hnsw(ticket_ids, vectors)
+        # The graph serves every query from here on; free the exact-search matrix
+        self.matrix = np.empty((0, self.matrix.shape[1]), dtype=self.matrix.dtype)
+        self.scales = np.empty(0, dtype=np.float32)
+
+    def abort_hnsw_build(self) -> None:
+        """Stop logging adds after a failed build (call under the index lock)."""
+        self.build_log = None
+
+
+def _exact_scores(matrix: np.ndarray, scales: np.ndarray, count: int, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of a unit query against the first count rows of a matrix."""
+    if matrix.dtype != np.int8:
+        return matrix[:count] @ query
+
+    # Dequantize block by block so the float32 scratch stays cache-sized
+    scores = np.empty(count, dtype=np.float32)
+    for start in range(0, count, _SCORE_BLOCK_ROWS):
+        end = min(start + _SCORE_BLOCK_ROWS, count)
+        scores[start:end] = matrix[start:end].astype(np.float32) @ query
+    scores *= scales[:count]
+    return scores
+
+
+class VectorIndex:
+    """Nearest-neighbour index over stored ticket embeddings, keyed by ticket_id.
+
+    Small indexes are searched exactly with a single matrix-vector product over
+    the normalized embedding matrix; the HNSW graph is only built, and searched,
+    once the index grows past exact_search_max. An add() that crosses that size
+    builds the graph on a background thread, and exact search keeps serving
+    until it is swapped in. When a PCA projection is given, vectors are reduced
+    before indexing and searching.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIMENSION, ef: int = 64, M: int = 16,
+                 ef_construction: int = 200, exact_search_max: int = 20000, quantize: bool = False,
+                 projection: Optional[PCAProjection] = None):
+        """Initialize an empty index.
+
+        Args:
+            dim: Embedding dimension
+            ef: HNSW query-time candidate list size (recall/latency trade-off)
+            M: HNSW graph out-degree
+            ef_construction: HNSW build-time candidate list size
+            exact_search_max: Largest index size searched exactly instead of via HNSW
+            quantize: Store the exact-search matrix as int8 (cosine error typically < 1%)
+            projection: Optional PCA projection applied to every stored and query vector
+        """
+        self.dim = dim
+        self.projection = projection
+        self.index_dim = projection.output_dim if projection is not None else dim
+        self.ef = ef
+        self.M = M
+        self.ef_construction = ef_construction
+        self.exact_search_max = exact_search_max
+        self.quantize = quantize
+        self.ready = False
+
+        self._lock = threading.Lock()
+        self._loading = False
+        self._added_during_load: List[Tuple[List[int], np.ndarray, List[str]]] = []
+        self._state = self._new_state(1024)
+        self._builder: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return self._state.count
+
+    def _new_state(self, capacity: int) -> _IndexState:
+        return _IndexState(self.index_dim, capacity, self.ef, self.M, self.ef_construction,
+                           self.exact_search_max, self.quantize)
+
+    def _normalize(self, vectors) -> np.ndarray:
+        """Return vectors as unit-length float32 rows, PCA-reduced if configured."""
+        vectors = np.array(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.projection is not None:
+            vectors = self.projection.transform(vectors)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def add(self, ticket_ids: Sequence[int], vectors, ticket_resolutions: Sequence[str]) -> None:
+        """Insert or update embeddings for the given tickets.
+
+        Args:
+            ticket_ids: Ticket identifiers (index labels)
+            vectors: One embedding per ticket
+            ticket_resolutions: Resolution text returned with each match
+        """
+        vectors = self._normalize(vectors)
+        with self._lock:
+            self._state.add(ticket_ids, vectors, ticket_resolutions)
+            if self._loading:
+                self._added_during_load.append((list(ticket_ids), vectors, list(ticket_resolutions)))
+            self._start_hnsw_build()
+
+    def _start_hnsw_build(self) -> None:
+        """Build the current state's graph on a background thread if it needs one.
+
+        Call under the lock. Building 20k+ rows takes seconds, so it must not
+        hold the lock or run on the caller's (often the event loop's) thread.
+        """
+        state = self._state
+        if not state.needs_hnsw():
+            return
+        rows = state.start_hnsw_build()
+        self._builder = threading.Thread(
+            target=self._build_hnsw, args=(state, *rows), name="vector-index-hnsw", daemon=True
+        )
+        self._builder.start()
+
+    def _build_hnsw(self, state: _IndexState, matrix: np.ndarray, scales: np.ndarray, labels: np.ndarray) -> None:
+        try:
+            hnsw = state.build_hnsw(matrix, scales, labels)
+        except Exception as e:
+            logger.error("Failed to build the HNSW graph, staying on exact search: %s", e, exc_info=True)
+            with self._lock:
+                state.abort_hnsw_build()
+            return
+        with self._lock:
+            state.install_hnsw(hnsw)
+
+    def begin_load(self) -> None:
+        """Start recording adds for replay by the next load().
+
+        Call this before issuing the snapshot query, so embeddings stored while
+        the snapshot is downloading are not lost when load() swaps it in.
+        """
+        with self._lock:
+            self._loading = True
+            self._added_during_load = []
+
+    def cancel_load(self) -> None:
+        """Stop recording adds after a snapshot failed before reaching load()."""
+        with self._lock:
+            self._loading = False
+            self._added_during_load = []
+
+    def load(self, ticket_ids: Sequence[int], vectors, ticket_resolutions: Sequence[str]) -> None:
+        """Rebuild the index from a full snapshot and swap it in.
+
+        Vectors added since begin_load() (or since this call, if begin_load()
+        was not used) are replayed onto the new index so the swap loses none.
+        """
+        with self._lock:
+            if not self._loading:
+                self._loading = True
+                self._added_during_load = []
+
+        try:
+            state = self._new_state(max(len(ticket_ids), 1024))
+            if len(ticket_ids):
+                state.add(ticket_ids, self._normalize(vectors), ticket_resolutions)
+            # Already off the serving path: build a large snapshot's graph before the swap
+            if state.needs_hnsw():
+                state.install_hnsw(state.build_hnsw(*state.start_hnsw_build()))
+
+            with self._lock:
+                for added in self._added_during_load:
+                    state.add(*added)
+                self._state = state
+                self.ready = True
+                self._start_hnsw_build()
+        finally:
+            self.cancel_load()
+
+    def search(self, vector, k: int) -> List[Tuple[int, str, float]]:
+        """Find the k stored embeddings closest to vector.
+
+        Returns:
+            List of (ticket_id, ticket_resolution, cosine_distance), nearest first
+        """
+        # Snapshot under the lock: the matrix is swapped out when the graph is built
+        with self._lock:
+            state = self._state
+            hnsw, matrix, scales, count = state.hnsw, state.matrix, state.scales, state.count
+
+        if count == 0 or k <= 0:
+            return []
+        k = min(k, count)
+        query = self._normalize(vector)
+
+        if hnsw is None:
+            scores = _exact_scores(matrix, scales, count, query[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (state.ticket_ids[row], state.resolutions[state.ticket_ids[row]], 1.0 - float(scores[row]))
+                for row in top
+            ]
+
+        labels, distances = hnsw.knn_query(query, k=k)
+        return [
+            (int(label), state.resolutions.get(int(label), ""), float(distance))
+            for label, distance in zip(labels[0], distances[0])
+        ]
+
+
+# Create a default instance shared by the embedding and retrieval services
+vector_index = VectorIndex(
+    exact_search_max=settings.VECTOR_INDEX_EXACT_SEARCH_MAX,
+    quantize=settings.VECTOR_INDEX_INT8,
+    projection=PCAProjection.load(settings.PCA_COMPONENTS_PATH)
+)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Fit a PCA projection over stored ticket embeddings for the in-process vector index.
+
+Usage:
+    python fit_pca.py [--components 256] [--sample 10000]
+"""
+
+import argparse
+
+import numpy as np
+from google.cloud import bigquery
+
+from app.core.config import settings
+from app.services.bigquery_service import bigquery_service
+from app.services.pca import PCAProjection
+
+
+def main():
+    """Sample stored embeddings, fit the projection and save it to PCA_COMPONENTS_PATH."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--components", type=int, default=256, help="Number of principal components to keep")
+    parser.add_argument("--sample", type=int, default=10000, help="Number of stored embeddings to fit on")
+    args = parser.parse_args()
+
+    sql = f"""
+    SELECT embedding_vector
+    FROM `{settings.GOOGLE_CLOUD_PROJECT}.embeddings.ticket_embeddings`
+    ORDER BY RAND()
+    LIMIT @sample
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("sample", "INT64", args.sample)]
+    )
+    rows = bigquery_service.client.query(sql, job_config=job_config).result()
+    vectors = np.asarray([row.embedding_vector for row in rows], dtype=np.float32)
+
+    projection = PCAProjection.fit(vectors, args.components)
+    projection.save(settings.PCA_COMPONENTS_PATH)
+
+    retained = np.square(projection.transform(vectors)).sum() / np.square(vectors).sum()
+    print(f"Saved {args.components}-component PCA fitted on {len(vectors)} embeddings "
+          f"to {settings.PCA_COMPONENTS_PATH} (retained energy: {retained:.1%})")
+
+
+if __name__ == "__main__":
+    main()
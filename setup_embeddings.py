@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Create or migrate the BigQuery objects backing ticket embeddings.
+
+Every statement is idempotent, so the script is safe to re-run after pulling
+schema changes.
+
+Usage:
+    python setup_embeddings.py
+"""
+
+from app.core.config import settings
+from app.services.bigquery_service import bigquery_service
+
+EMBEDDINGS_TABLE = f"`{settings.GOOGLE_CLOUD_PROJECT}.embeddings.ticket_embeddings`"
+TICKETS_RAG_VIEW = f"`{settings.GOOGLE_CLOUD_PROJECT}.{settings.BIGQUERY_DATASET_ID}.tickets_rag`"
+
+STATEMENTS = [
+    # Base table, clustered on text_hash so stored-embedding cache lookups prune blocks
+    f"""
+    CREATE TABLE IF NOT EXISTS {EMBEDDINGS_TABLE} (
+      ticket_id INT64,
+      embedding_vector ARRAY<FLOAT64>,
+      embedding_int8 BYTES,
+      embedding_scale FLOAT64,
+      ticket_resolution STRING,
+      text_hash STRING
+    )
+    CLUSTER BY text_hash
+    """,
+    # Tables created before text_hash existed
+    f"""
+    ALTER TABLE {EMBEDDINGS_TABLE}
+    ADD COLUMN IF NOT EXISTS text_hash STRING
+    """,
+    # int8 copy of each embedding (codes * embedding_scale ~= embedding_vector), read by the index load
+    f"""
+    ALTER TABLE {EMBEDDINGS_TABLE}
+    ADD COLUMN IF NOT EXISTS embedding_int8 BYTES,
+    ADD COLUMN IF NOT EXISTS embedding_scale FLOAT64
+    """,
+    # Backfill rows stored before embedding_int8 existed, quantizing like quantize_int8()
+    f"""
+    UPDATE {EMBEDDINGS_TABLE}
+    SET
+      embedding_scale = (SELECT MAX(ABS(x)) / 127 FROM UNNEST(embedding_vector) x),
+      embedding_int8 = CODE_POINTS_TO_BYTES(ARRAY(
+        SELECT MOD(CAST(ROUND(IFNULL(SAFE_DIVIDE(x * 127, (SELECT MAX(ABS(y)) FROM UNNEST(embedding_vector) y)), 0)) AS INT64) + 256, 256)
+        FROM UNNEST(embedding_vector) x WITH OFFSET o
+        ORDER BY o
+      ))
+    WHERE embedding_int8 IS NULL AND embedding_vector IS NOT NULL
+    """,
+    # ANN index for VECTOR_SEARCH; BigQuery only builds it once the table holds 5000+ rows
+    f"""
+    CREATE VECTOR INDEX IF NOT EXISTS ticket_embeddings_idx
+    ON {EMBEDDINGS_TABLE}(embedding_vector)
+    OPTIONS(index_type = 'IVF', distance_type = 'COSINE', ivf_options = '{{"num_lists": 100}}')
+    """,
+    # Unused view created by earlier versions of this script
+    f"""
+    DROP VIEW IF EXISTS {TICKETS_RAG_VIEW}
+    """,
+]
+
+
+def main():
+    """Run every setup statement in order."""
+    for statement in STATEMENTS:
+        bigquery_service.client.query(statement).result()
+        print(f"OK: {' '.join(statement.split())[:80]}")
+
+
+if __name__ == "__main__":
+    main()
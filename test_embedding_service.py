@@ -6,6 +6,7 @@ Test script for EmbeddingService functionality.
 import asyncio
 import sys
 from pathlib import Path
+import numpy as np
 
 # Add the app directory to the Python path
 sys.path.insert(0, str(Path(__file__).parent / "app"))
@@ -96,11 +97,11 @@ async def test_embedding_service():
     try:
         embedding = await service.generate_embedding(test_text)
         
-        if isinstance(embedding, list) and len(embedding) == 768:
+        if isinstance(embedding, np.ndarray) and embedding.shape == (768,):
             print(f"✅ Generated 768-dimensional embedding")
             print(f"   First 5 values: {embedding[:5]}")
         else:
-            print(f"❌ Expected 768-dimensional list, got {type(embedding)} with length {len(embedding) if isinstance(embedding, list) else 'N/A'}")
+            print(f"❌ Expected 768-dimensional array, got {type(embedding)} with shape {getattr(embedding, 'shape', 'N/A')}")
             return False
             
     except Exception as e:
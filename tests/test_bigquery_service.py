@@ -0,0 +1,87 @@
+"""
+Tests for the BigQueryService class.
+"""
+
+import pytest
+import threading
+import time
+from unittest.mock import Mock, patch
+from google.cloud import bigquery
+from app.services.bigquery_service import BigQueryService, _CLIENT_CACHE, _load_credentials
+
+
+class TestBigQueryService:
+    """Test cases for BigQueryService."""
+
+    @pytest.fixture(autouse=True)
+    def clear_client_cache(self):
+        """Build a fresh (patched) BigQuery client for every test."""
+        _CLIENT_CACHE.clear()
+        _load_credentials.cache_clear()
+        yield
+        _CLIENT_CACHE.clear()
+        _load_credentials.cache_clear()
+
+    @pytest.fixture
+    def mock_bigquery_client(self):
+        """Mock BigQuery client for testing."""
+        with patch('app.services.bigquery_service.bigquery.Client') as mock_client, \
+             patch('app.services.bigquery_service.service_account.Credentials.from_service_account_file'):
+            yield mock_client
+
+    def test_services_share_one_client(self, mock_bigquery_client):
+        """Test every service instance reuses the client built for its project and key file."""
+        s1 = BigQueryService(dataset_id="dataset", table_id="table")
+        s2 = BigQueryService(dataset_id="other_dataset", table_id="other_table")
+
+        assert s1.client is s2.client
+        mock_bigquery_client.assert_called_once()
+
+    def test_concurrent_first_use_creates_one_client(self):
+        """Test services built from racing threads share a single client creation."""
+        def slow_create(project, credentials_path):
+            time.sleep(0.05)  # widen the window for a second creation
+            return Mock()
+
+        barrier = threading.Barrier(4)
+        services = []
+
+        def build():
+            barrier.wait()
+            services.append(BigQueryService(dataset_id="dataset", table_id="table"))
+
+        with patch('app.services.bigquery_service._create_client', side_effect=slow_create) as create_client:
+            threads = [threading.Thread(target=build) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        create_client.assert_called_once()
+        assert len({id(service.client) for service in services}) == 1
+
+    def test_client_uses_short_query_mode(self, mock_bigquery_client):
+        """Test the client lets BigQuery skip job creation for short queries."""
+        BigQueryService(dataset_id="dataset", table_id="table")
+
+        kwargs = mock_bigquery_client.call_args.kwargs
+        assert kwargs["default_job_creation_mode"] == bigquery.enums.JobCreationMode.JOB_CREATION_OPTIONAL
+
+    def test_client_short_query_mode_disabled(self, mock_bigquery_client):
+        """Test BIGQUERY_SHORT_MODE=False keeps BigQuery's default job creation."""
+        with patch('app.services.bigquery_service.settings.BIGQUERY_SHORT_MODE', False):
+            BigQueryService(dataset_id="dataset", table_id="table")
+
+        assert mock_bigquery_client.call_args.kwargs["default_job_creation_mode"] is None
+
+    def test_query_arrow_forwards_job_config(self, mock_bigquery_client):
+        """Test query_arrow runs through query_and_wait with the caller's job config."""
+        service = BigQueryService(dataset_id="dataset", table_id="table")
+        job_config = bigquery.QueryJobConfig()
+
+        with patch.object(service, '_get_bqstorage_client'):
+            service.query_arrow("SELECT 1", job_config)
+
+        client = mock_bigquery_client.return_value
+        client.query_and_wait.assert_called_once_with("SELECT 1", job_config=job_config)
+        client.query.assert_not_called()
@@ -2,14 +2,30 @@
 Tests for the EmbeddingService class.
 """
 
+import asyncio
+import numpy as np
+import os
+import pyarrow as pa
 import pytest
-from unittest.mock import Mock, patch
+import time
+from collections import deque
+from unittest.mock import AsyncMock, Mock, patch
+from app.services.bigquery_service import _CLIENT_CACHE, _load_credentials
 from app.services.embedding_service import EmbeddingService
 
 
 class TestEmbeddingService:
     """Test cases for EmbeddingService."""
 
+    @pytest.fixture(autouse=True)
+    def clear_client_cache(self):
+        """Build a fresh (patched) BigQuery client for every test."""
+        _CLIENT_CACHE.clear()
+        _load_credentials.cache_clear()
+        yield
+        _CLIENT_CACHE.clear()
+        _load_credentials.cache_clear()
+
     @pytest.fixture
     def mock_bigquery_client(self):
         """Mock BigQuery client for testing."""
@@ -19,9 +35,11 @@ class TestEmbeddingService:
     @pytest.fixture
     def embedding_service(self, mock_bigquery_client):
         """Create EmbeddingService instance with mocked dependencies."""
-        with patch('app.services.embedding_service.service_account.Credentials.from_service_account_file'):
+        with patch('app.services.bigquery_service.service_account.Credentials.from_service_account_file'):
             service = EmbeddingService()
+            service.bigquery_service = Mock()
             service.client = Mock()
+            service._store_cache_enabled = False
             return service
 
     @pytest.mark.asyncio
@@ -29,20 +47,246 @@ class TestEmbeddingService:
         """Test successful embedding generation."""
         # Mock the query result with 768-dimensional embedding
         mock_embedding = [0.1] * 768  # 768-dimensional vector
-        mock_row = Mock()
-        mock_row.ml_generate_text_embedding_result = mock_embedding
-        
-        mock_query_job = Mock()
-        mock_query_job.result.return_value = [mock_row]
-        embedding_service.client.query.return_value = mock_query_job
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [mock_embedding]})
         
         # Test
         result = await embedding_service.generate_embedding("test text")
         
         # Assertions
-        assert result == mock_embedding
-        assert len(result) == 768
-        embedding_service.client.query.assert_called_once()
+        assert result.dtype == np.float32
+        assert result.shape == (768,)
+        assert np.allclose(result, mock_embedding)
+        query_arrow.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_cached(self, embedding_service):
+        """Test a repeated text is served from the in-process cache."""
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[0.1] * 768]})
+        
+        first = await embedding_service.generate_embedding("test text")
+        second = await embedding_service.generate_embedding("test text")
+        
+        assert np.allclose(first, second)
+        assert query_arrow.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_disk_cache_survives_restart(self, mock_bigquery_client, tmp_path):
+        """Test an embedding flushed to the disk cache is reused by a new service."""
+        mock_embedding = np.random.default_rng(0).normal(size=768).astype(np.float32)
+        with patch('app.services.bigquery_service.service_account.Credentials.from_service_account_file'), \
+             patch('app.services.embedding_service.settings.EMBEDDING_DISK_CACHE_DIR', str(tmp_path)):
+            first = EmbeddingService()
+            first.bigquery_service = Mock()
+            first._store_cache_enabled = False
+            first.bigquery_service.query_arrow.return_value = pa.table({"embedding": [mock_embedding.tolist()]})
+            await first.generate_embedding("test text")
+            first.flush_disk_cache()
+
+            second = EmbeddingService()
+            second.bigquery_service = Mock()
+            result = await second.generate_embedding("test text")
+        
+        # Stored as int8 codes, so equal to within one quantization step
+        assert np.allclose(result, mock_embedding, atol=np.abs(mock_embedding).max() / 127)
+        assert second.bigquery_service.query_arrow.call_count == 0
+
+    def test_disk_cache_keeps_only_pending_entries_in_memory(self, mock_bigquery_client, tmp_path):
+        """Test flushed entries are served from the cache file, including after a torn write."""
+        vectors = np.random.default_rng(0).normal(size=(7, 768)).astype(np.float32)
+        with patch('app.services.bigquery_service.service_account.Credentials.from_service_account_file'), \
+             patch('app.services.embedding_service.settings.EMBEDDING_DISK_CACHE_DIR', str(tmp_path)), \
+             patch('app.services.embedding_service.settings.EMBEDDING_DISK_CACHE_FLUSH_EVERY', 2):
+            service = EmbeddingService()
+            keys = [service._cache_key(f"text {i}") for i in range(7)]
+            for key, vector in zip(keys[:5], vectors):
+                service._cache_put(key, vector)
+            
+            assert list(service._disk_pending) == [keys[4]]
+            
+            # A writer that crashed mid-record must not misalign later appends
+            with open(tmp_path / "cache.bin", "ab") as f:
+                f.write(b"torn")
+            for key, vector in zip(keys[5:], vectors[5:]):
+                service._cache_put(key, vector)
+            service.flush_disk_cache()
+            
+            restarted = EmbeddingService()
+        
+        for key, vector in zip(keys, vectors):
+            for cache in (service, restarted):
+                assert np.allclose(cache._disk_get(key), vector, atol=np.abs(vector).max() / 127)
+        assert restarted._disk_get(service._cache_key("missing")) is None
+
+    @pytest.mark.asyncio
+    async def test_fuzzy_cache_hit_on_typo(self, embedding_service):
+        """Test a retold ticket with a typo reuses the cached embedding and an unrelated one does not."""
+        ticket = ("Subject: Login issue\nIssue: I cannot log in to my account after resetting "
+                  "my password this morning; the login page just reloads.")
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[0.1] * 768]})
+        embedding_service._simhash_ring = deque(maxlen=256)
+        
+        first = await embedding_service.generate_embedding(ticket)
+        typo = await embedding_service.generate_embedding(ticket.replace("account", "acount"))
+        await embedding_service.generate_embedding("Subject: Billing question\nIssue: I was charged twice this month.")
+        
+        assert np.array_equal(typo, first)
+        assert query_arrow.call_count == 2
+        # A borrowed embedding is never cached under the new text's key
+        assert embedding_service._cache_key(ticket.replace("account", "acount")) not in embedding_service._embedding_cache
+
+    @pytest.mark.asyncio
+    async def test_embed_tickets_stream_skips_fuzzy_cache(self, embedding_service):
+        """Test tickets headed for storage are embedded exactly, never from the fuzzy cache."""
+        ticket = {"subject": "Login issue", "description": "I cannot log in to my account after "
+                  "resetting my password this morning; the login page just reloads."}
+        retold = {**ticket, "description": ticket["description"].replace("account", "acount")}
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[0.1] * 768]})
+        embedding_service._simhash_ring = deque(maxlen=256)
+        
+        await embedding_service.generate_ticket_embedding(ticket)
+        results = [item async for item in embedding_service.embed_tickets_stream([retold])]
+        
+        assert len(results) == 1
+        assert query_arrow.call_count == 2
+
+    def test_embedding_cache_quantization_roundtrip(self, embedding_service):
+        """Test the int8 cache keeps cached embeddings within 0.1% cosine of the original."""
+        embedding = np.random.default_rng(0).normal(size=768).astype(np.float32)
+        key = embedding_service._cache_key("text")
+        embedding_service._cache_put(key, embedding)
+        
+        codes, _ = embedding_service._embedding_cache[key]
+        restored = embedding_service._cache_get(key)
+        cosine = embedding @ restored / (np.linalg.norm(embedding) * np.linalg.norm(restored))
+        
+        assert codes.dtype == np.int8
+        assert restored.dtype == np.float32
+        assert cosine >= 0.999
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_cache_normalizes_key(self, embedding_service):
+        """Test near-identical texts share one cached embedding."""
+        mock_embedding = [0.1] * 768
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [mock_embedding]})
+        
+        first = await embedding_service.generate_embedding("Login Issue")
+        second = await embedding_service.generate_embedding("  login issue ")
+        
+        assert np.allclose(first, mock_embedding)
+        assert np.allclose(second, mock_embedding)
+        query_arrow.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_coalesces_concurrent_calls(self, embedding_service):
+        """Test concurrent cache misses are served by one batched query."""
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[float(i)] * 768 for i in range(3)]})
+        
+        results = await asyncio.gather(
+            embedding_service.generate_embedding("first"),
+            embedding_service.generate_embedding("second"),
+            embedding_service.generate_embedding("third"),
+        )
+        
+        assert [r[0] for r in results] == [0.0, 1.0, 2.0]
+        query_arrow.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_coalesced_duplicates_embedded_once(self, embedding_service):
+        """Test concurrent calls for the same text share one row of the batch query."""
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[0.0] * 768, [1.0] * 768]})
+        
+        results = await asyncio.gather(
+            embedding_service.generate_embedding("Password reset"),
+            embedding_service.generate_embedding("other"),
+            embedding_service.generate_embedding("password reset "),
+        )
+        
+        assert [r[0] for r in results] == [0.0, 1.0, 0.0]
+        job_config = query_arrow.call_args.args[1]
+        assert len(job_config.query_parameters[0].values) == 2
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_does_not_block_loop(self, embedding_service):
+        """Test blocking BigQuery calls run in worker threads, so concurrent embeds overlap."""
+        def slow_query(query, job_config):
+            time.sleep(0.05)
+            return pa.table({"embedding": [[0.1] * 768]})
+        
+        embedding_service.bigquery_service.query_arrow.side_effect = slow_query
+        embedding_service._batch_max_size = 1  # one query per text, no coalescing
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(embedding_service.generate_embedding(f"text {i}") for i in range(4)))
+        
+        assert time.perf_counter() - start < 0.15
+        assert embedding_service.bigquery_service.query_arrow.call_count == 4
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_bad_row_fails_only_its_caller(self, embedding_service):
+        """Test a malformed row in a coalesced batch fails only that caller."""
+        embedding_service.bigquery_service.query_arrow.return_value = pa.table(
+            {"embedding": [[0.1] * 768, [0.1] * 512]}
+        )
+        
+        good, bad = await asyncio.gather(
+            embedding_service.generate_embedding("good"),
+            embedding_service.generate_embedding("bad"),
+            return_exceptions=True,
+        )
+        
+        assert np.allclose(good, [0.1] * 768)
+        assert "Expected 768-dimensional vector" in str(bad)
+
+    @pytest.mark.asyncio
+    async def test_generate_embeddings_batch_single_query(self, embedding_service):
+        """Test a batch embeds only distinct uncached texts, in one query."""
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[float(i)] * 768 for i in range(2)]})
+        embedding_service._cache_put(embedding_service._cache_key("cached"), np.full(768, 9.0, dtype=np.float32))
+        
+        results = await embedding_service.generate_embeddings_batch(["first", "cached", "second", "First "])
+        
+        assert [r[0] for r in results] == [0.0, 9.0, 1.0, 0.0]
+        query_arrow.assert_called_once()
+        job_config = query_arrow.call_args.args[1]
+        assert job_config.query_parameters[0].values == ["first", "second"]
+
+    @pytest.mark.asyncio
+    async def test_embed_sql_is_parameterized(self, embedding_service):
+        """Test user text is bound as a query parameter, never interpolated into the SQL."""
+        text = "'); DROP TABLE tickets; --"
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[0.1] * 768]})
+        
+        await embedding_service.generate_embedding(text)
+        
+        sql, job_config = query_arrow.call_args.args
+        assert sql == embedding_service._embed_query
+        assert text not in sql
+        assert job_config.query_parameters[0].values == [text]
+
+    @pytest.mark.asyncio
+    async def test_generate_embedding_uses_stored_embedding(self, embedding_service):
+        """Test an embedding already stored under the text's hash skips ML generation."""
+        embedding_service._store_cache_enabled = True
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({
+            "text_hash": [embedding_service._cache_key("known issue").hex()],
+            "embedding": [[0.5] * 768],
+        })
+        
+        result = await embedding_service.generate_embedding("Known issue")
+        
+        assert np.allclose(result, [0.5] * 768)
+        query_arrow.assert_called_once()
+        assert "text_hash IN UNNEST(@text_hashes)" in query_arrow.call_args.args[0]
 
     @pytest.mark.asyncio
     async def test_generate_embedding_empty_text(self, embedding_service):
@@ -57,7 +301,7 @@ class TestEmbeddingService:
     async def test_generate_embedding_failure(self, embedding_service):
         """Test embedding generation failure."""
         # Mock query failure
-        embedding_service.client.query.side_effect = Exception("Query failed")
+        embedding_service.bigquery_service.query_arrow.side_effect = Exception("Query failed")
         
         # Test and assert exception
         with pytest.raises(Exception, match="Failed to generate embedding"):
@@ -68,17 +312,20 @@ class TestEmbeddingService:
         """Test embedding generation with wrong dimensions."""
         # Mock result with wrong dimensions
         mock_embedding = [0.1] * 512  # Wrong dimension
-        mock_row = Mock()
-        mock_row.ml_generate_text_embedding_result = mock_embedding
-        
-        mock_query_job = Mock()
-        mock_query_job.result.return_value = [mock_row]
-        embedding_service.client.query.return_value = mock_query_job
+        embedding_service.bigquery_service.query_arrow.return_value = pa.table({"embedding": [mock_embedding]})
         
         # Test and assert exception
         with pytest.raises(Exception, match="Expected 768-dimensional vector"):
             await embedding_service.generate_embedding("test text")
 
+    def test_validate_vector_normalizes(self, embedding_service):
+        """Test stored vectors are L2-normalized and zero vectors rejected."""
+        vector = embedding_service._validate_vector([3.0] + [4.0] + [0.0] * 766)
+        
+        assert vector[:2] == pytest.approx([0.6, 0.8])
+        with pytest.raises(ValueError, match="non-zero"):
+            embedding_service._validate_vector([0.0] * 768)
+
     def test_prepare_ticket_text_complete(self, embedding_service):
         """Test prepare_ticket_text with complete ticket."""
         ticket = {
@@ -151,26 +398,67 @@ class TestEmbeddingService:
         
         assert result == expected
 
-    def test_get_field_value_multiple_names(self, embedding_service):
-        """Test _get_field_value with multiple possible field names."""
+    @pytest.mark.skipif(os.environ.get("PERF_TESTS") != "1", reason="set PERF_TESTS=1 to run")
+    def test_prepare_ticket_text_strip_called_once(self, embedding_service):
+        """Test each field value is stripped exactly once, blank or not."""
+        strip_calls = []
+
+        class CountingStr(str):
+            def strip(self, *args):
+                strip_calls.append(str(self))
+                return super().strip(*args)
+
+        class Field:
+            def __init__(self, value):
+                self.value = value
+
+            def __str__(self):
+                return CountingStr(self.value)
+
+        ticket = {
+            "subject": Field("  Test Subject  "),
+            "description": Field("   "),
+            "resolution": Field("Fixed it"),
+        }
+        
+        result = embedding_service.prepare_ticket_text(ticket)
+        
+        assert result == "Subject: Test Subject\nResolution: Fixed it"
+        assert len(strip_calls) == 3
+
+    def test_prepare_ticket_text_prefixed_names(self, embedding_service):
+        """Test prepare_ticket_text reads ticket_-prefixed field names."""
         ticket = {
             "ticket_subject": "Test Subject"
         }
         
-        # Should find ticket_subject when looking for subject or ticket_subject
-        result = embedding_service._get_field_value(ticket, ['subject', 'ticket_subject'])
+        result = embedding_service.prepare_ticket_text(ticket)
         
-        assert result == "Test Subject"
+        assert result == "Subject: Test Subject"
 
-    def test_get_field_value_not_found(self, embedding_service):
-        """Test _get_field_value when field is not found."""
+    def test_prepare_ticket_text_unknown_fields(self, embedding_service):
+        """Test prepare_ticket_text ignores fields it does not know."""
         ticket = {
             "other_field": "value"
         }
         
-        result = embedding_service._get_field_value(ticket, ['subject', 'ticket_subject'])
+        result = embedding_service.prepare_ticket_text(ticket)
+        
+        assert result == ""
+
+    def test_prepare_ticket_text_prefers_prefixed_fields(self, embedding_service):
+        """Test the ticket_ form of a field wins when a ticket has both forms."""
+        ticket = {
+            "subject": "Plain",
+            "ticket_subject": "Prefixed",
+            "ticket_description": None,
+            "description": "Issue",
+            "ticket_id": 7
+        }
+        
+        result = embedding_service.prepare_ticket_text(ticket)
         
-        assert result is None
+        assert result == "Subject: Prefixed\nIssue: Issue"
 
     @pytest.mark.asyncio
     async def test_generate_ticket_embedding_success(self, embedding_service):
@@ -181,12 +469,26 @@ class TestEmbeddingService:
         }
         
         # Mock the generate_embedding method
-        mock_embedding = [0.1] * 768
+        mock_embedding = np.full(768, 0.1, dtype=np.float32)
         with patch.object(embedding_service, 'generate_embedding', return_value=mock_embedding):
             result = await embedding_service.generate_ticket_embedding(ticket)
             
-            assert result == mock_embedding
-            assert len(result) == 768
+            assert result is mock_embedding
+            assert result.shape == (768,)
+            assert result.dtype == np.float32
+
+    @pytest.mark.asyncio
+    async def test_generate_embeddings_batch(self, embedding_service):
+        """Test a list of tickets is embedded with one query, in ticket order."""
+        tickets = [{"subject": f"Ticket {i}", "description": f"Issue {i}"} for i in range(5)]
+        query_arrow = embedding_service.bigquery_service.query_arrow
+        query_arrow.return_value = pa.table({"embedding": [[float(i)] * 768 for i in range(5)]})
+        
+        results = await embedding_service.generate_ticket_embedding(tickets)
+        
+        assert [r[0] for r in results] == [0.0, 1.0, 2.0, 3.0, 4.0]
+        query_arrow.assert_called_once()
+        assert len(query_arrow.call_args.args[1].query_parameters[0].values) == 5
 
     @pytest.mark.asyncio
     async def test_generate_ticket_embedding_empty_ticket(self, embedding_service):
@@ -195,28 +497,121 @@ class TestEmbeddingService:
         
         with pytest.raises(ValueError, match="No valid text found in ticket"):
             await embedding_service.generate_ticket_embedding(ticket)
+        with pytest.raises(ValueError, match="No valid text found in ticket"):
+            await embedding_service.generate_ticket_embedding([{"subject": "Login issue"}, ticket])
+        
+        embedding_service.bigquery_service.query_arrow.assert_not_called()
+        embedding_service.client.query.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_ingest_tickets_pipeline(self, embedding_service):
+        """Test ingestion embeds in bounded batches and stores every embeddable ticket."""
+        tickets = [{"ticket_id": i, "subject": f"Ticket {i}", "resolution": f"Fix {i}"} for i in range(9)]
+        tickets += [{"ticket_id": 9, "ticket_subject": "Ticket 9", "ticket_resolution": "Fix 9"}, {"ticket_id": 99}]
+        batch_sizes = []
+        
+        async def fake_batch(texts, return_exceptions=False, fuzzy=True):
+            assert not fuzzy
+            batch_sizes.append(len(texts))
+            return [[0.1] * 768 for _ in texts]
+        
+        embedding_service.generate_embeddings_batch = fake_batch
+        embedding_service.store_embeddings_bulk = AsyncMock(return_value={"status": "success"})
+        
+        stored = await embedding_service.ingest_tickets(tickets, embed_batch=4, upsert_batch=3)
+        
+        assert stored == 10
+        assert sum(batch_sizes) == 10
+        assert max(batch_sizes) <= 4
+        upserts = [call.args[0] for call in embedding_service.store_embeddings_bulk.call_args_list]
+        assert max(len(rows) for rows in upserts) <= 3
+        assert sorted(row[0] for rows in upserts for row in rows) == list(range(10))
+        assert all(row[2] == f"Fix {row[0]}" for rows in upserts for row in rows)
+
+    @pytest.mark.asyncio
+    async def test_embed_tickets_stream_backpressure(self, embedding_service):
+        """Test a slow consumer holds back the ticket source instead of buffering every ticket."""
+        concurrency, batch_size = 4, 8
+        pulled = 0
+        
+        async def ticket_source():
+            nonlocal pulled
+            for i in range(1000):
+                pulled += 1
+                yield {"ticket_id": i, "subject": f"Ticket {i}"}
+        
+        async def fake_batch(texts, return_exceptions=False, fuzzy=True):
+            return [np.zeros(768, dtype=np.float32) for _ in texts]
+        
+        embedding_service.generate_embeddings_batch = fake_batch
+        
+        received, peak_in_flight = 0, 0
+        async for ticket, text, embedding in embedding_service.embed_tickets_stream(
+            ticket_source(), batch_size=batch_size, concurrency=concurrency
+        ):
+            received += 1
+            peak_in_flight = max(peak_in_flight, pulled - received)
+            await asyncio.sleep(0)
+        
+        assert received == 1000
+        # Two queues of 2 * concurrency, one batch held per worker, one ticket being prepared
+        assert peak_in_flight <= 4 * concurrency + concurrency * batch_size + 1
+
+    @pytest.mark.asyncio
+    async def test_store_embeddings_bulk_single_merge(self, embedding_service):
+        """Test many rows are written by one MERGE, keeping the last row per ticket."""
+        with patch('app.services.embedding_service.vector_index'):
+            await embedding_service.store_embeddings_bulk([
+                (1, [0.1] * 768, "old", None),
+                (2, [0.2] * 768, "fix", "text"),
+                (1, [0.3] * 768, "new", None),
+            ])
+        
+        embedding_service.client.query.assert_called_once()
+        sql = embedding_service.client.query.call_args.args[0]
+        rows = embedding_service.client.query.call_args.kwargs["job_config"].query_parameters[0].values
+        assert "FROM UNNEST(@rows)" in sql
+        assert [row.struct_values["ticket_id"] for row in rows] == [1, 2]
+        assert rows[0].struct_values["ticket_resolution"] == "new"
+
+    @pytest.mark.asyncio
+    async def test_store_embeddings_bulk_writes_int8_copy(self, embedding_service):
+        """Test each stored row carries int8 codes that dequantize to its vector."""
+        vector = np.random.default_rng(0).normal(size=768)
+        with patch('app.services.embedding_service.vector_index'):
+            await embedding_service.store_embeddings_bulk([(1, vector, "fix", None)])
+
+        row = embedding_service.client.query.call_args.kwargs["job_config"].query_parameters[0].values[0]
+        codes = np.frombuffer(row.struct_values["embedding_int8"], dtype=np.int8)
+        restored = codes * row.struct_values["embedding_scale"]
+
+        assert len(codes) == 768
+        assert np.allclose(restored, vector / np.linalg.norm(vector), atol=row.struct_values["embedding_scale"])
 
     @pytest.mark.asyncio
     async def test_test_connection_success(self, embedding_service):
         """Test successful connection test."""
-        # Mock list_datasets
-        mock_datasets = [Mock(), Mock()]  # 2 datasets
-        embedding_service.client.list_datasets.return_value = mock_datasets
+        # Mock the BigQuery connection check
+        embedding_service.bigquery_service.test_connection = AsyncMock(
+            return_value={"status": "success", "message": "Successfully connected to BigQuery"}
+        )
         
         # Mock generate_embedding
-        mock_embedding = [0.1] * 768
+        mock_embedding = np.full(768, 0.1, dtype=np.float32)
         with patch.object(embedding_service, 'generate_embedding', return_value=mock_embedding):
             result = await embedding_service.test_connection()
             
             assert result["status"] == "success"
-            assert "2 datasets" in result["message"]
+            assert "768-dimensional embedding" in result["message"]
             assert result["embedding_dimension"] == 768
 
     @pytest.mark.asyncio
     async def test_test_connection_failure(self, embedding_service):
         """Test connection test failure."""
         # Mock connection failure
-        embedding_service.client.list_datasets.side_effect = Exception("Connection failed")
+        embedding_service.bigquery_service.test_connection = AsyncMock(
+            return_value={"status": "error", "message": "Connection failed"}
+        )
         
         result = await embedding_service.test_connection()
         
@@ -226,11 +621,13 @@ class TestEmbeddingService:
     def test_initialization(self):
         """Test EmbeddingService initialization."""
         with patch('app.services.embedding_service.bigquery.Client'), \
-             patch('app.services.embedding_service.service_account.Credentials.from_service_account_file'), \
+             patch('app.services.bigquery_service.service_account.Credentials.from_service_account_file'), \
              patch('app.services.embedding_service.settings') as mock_settings:
             
             mock_settings.GOOGLE_CLOUD_PROJECT = "test-project"
             mock_settings.BIGQUERY_DATASET_ID = "test-dataset"
+            mock_settings.EMBEDDING_DISK_CACHE_DIR = None
+            mock_settings.EMBEDDING_FUZZY_CACHE_SIZE = 256
             
             service = EmbeddingService()
             
@@ -0,0 +1,56 @@
+"""
+Tests for the RetrievalService class.
+"""
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.retrieval_service import RetrievalService
+
+
+class TestRetrievalService:
+    """Test cases for RetrievalService."""
+
+    @pytest.fixture
+    def retrieval_service(self):
+        """Create RetrievalService instance with a mocked embedding service."""
+        service = RetrievalService()
+        service.embedding_service = AsyncMock()
+        return service
+
+    @pytest.fixture
+    def mock_vector_index(self):
+        """Mock a loaded in-process vector index."""
+        with patch('app.services.retrieval_service.vector_index') as mock_index:
+            mock_index.ready = True
+            mock_index.search.return_value = [(1, "Reset it from the login page", 0.1)]
+            yield mock_index
+
+    @pytest.mark.asyncio
+    async def test_search_similar_tickets_semantic_cache(self, retrieval_service, mock_vector_index):
+        """Test a near-identical query is answered from the cache and a different one is not."""
+        rng = np.random.default_rng(0)
+        query = rng.normal(size=768).astype(np.float32)
+        near = query + 0.01 * rng.normal(size=768).astype(np.float32)
+        other = rng.normal(size=768).astype(np.float32)
+        retrieval_service.embedding_service.generate_embedding.side_effect = [query, near, other]
+
+        first = await retrieval_service.search_similar_tickets("how do I reset my password?")
+        second = await retrieval_service.search_similar_tickets("how can I reset my password?")
+        await retrieval_service.search_similar_tickets("billing question")
+
+        assert second == first
+        assert first[0]["ticket_id"] == 1
+        assert mock_vector_index.search.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_search_similar_tickets_cache_needs_enough_results(self, retrieval_service, mock_vector_index):
+        """Test results cached for a smaller limit do not answer a larger one."""
+        query = np.ones(768, dtype=np.float32)
+        retrieval_service.embedding_service.generate_embedding.return_value = query
+
+        await retrieval_service.search_similar_tickets("query", limit=5)
+        await retrieval_service.search_similar_tickets("query", limit=3)
+        await retrieval_service.search_similar_tickets("query", limit=10)
+
+        assert mock_vector_index.search.call_count == 2
@@ -0,0 +1,174 @@
+"""
+Tests for the VectorIndex class.
+"""
+
+import numpy as np
+import threading
+from unittest.mock import patch
+from app.services.pca import PCAProjection
+from app.services.vector_index import VectorIndex, _IndexState, quantize_int8
+
+
+def _unit_vectors(n, dim=768, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_search_returns_nearest_first():
+    """Test search ranks the exact match first with ~zero distance."""
+    vectors = _unit_vectors(20)
+    index = VectorIndex()
+    index.load(list(range(20)), vectors, [f"resolution {i}" for i in range(20)])
+
+    results = index.search(vectors[4], k=3)
+
+    assert index.ready
+    assert len(results) == 3
+    assert results[0][:2] == (4, "resolution 4")
+    assert abs(results[0][2]) < 1e-5
+
+
+def test_add_updates_existing_ticket():
+    """Test re-adding a ticket replaces its vector instead of duplicating it."""
+    vectors = _unit_vectors(3)
+    index = VectorIndex()
+    index.add([1, 2], vectors[:2], ["old", "other"])
+    index.add([1], vectors[2:], ["new"])
+
+    results = index.search(vectors[2], k=1)
+
+    assert len(index) == 2
+    assert results[0][:2] == (1, "new")
+
+
+def test_load_replays_adds_since_begin_load():
+    """Test embeddings added between begin_load() and load() survive the swap."""
+    vectors = _unit_vectors(3)
+    index = VectorIndex()
+    index.begin_load()
+    index.add([3], vectors[2:], ["stored during download"])
+    index.load([1, 2], vectors[:2], ["", ""])
+
+    assert len(index) == 3
+    assert index.search(vectors[2], k=1)[0][:2] == (3, "stored during download")
+
+
+def test_exact_search_matches_hnsw():
+    """Test the exact matrix path and the HNSW path rank neighbours alike."""
+    vectors = _unit_vectors(200)
+    exact = VectorIndex(exact_search_max=1000)
+    approximate = VectorIndex(exact_search_max=0)
+    for index in (exact, approximate):
+        index.load(list(range(200)), vectors, [""] * 200)
+
+    query = vectors[10] + 0.1 * vectors[11]
+    exact_results = exact.search(query, k=5)
+    approximate_results = approximate.search(query, k=5)
+
+    assert [r[0] for r in exact_results] == [r[0] for r in approximate_results]
+    assert np.allclose([r[2] for r in exact_results], [r[2] for r in approximate_results], atol=1e-4)
+
+
+def test_hnsw_built_only_past_exact_search_max():
+    """Test the HNSW graph is built once the index outgrows exact search."""
+    vectors = _unit_vectors(6)
+    index = VectorIndex(exact_search_max=4, quantize=True)
+    index.load(list(range(4)), vectors[:4], [""] * 4)
+
+    assert index._state.hnsw is None
+
+    index.add([4, 5], vectors[4:], ["", ""])
+    index._builder.join()
+
+    assert index._state.hnsw is not None
+    assert len(index._state.matrix) == 0
+    assert index.search(vectors[5], k=1)[0][0] == 5
+    assert index.search(vectors[1], k=1)[0][0] == 1
+
+
+def test_hnsw_built_in_background():
+    """Test exact search keeps serving while the graph builds, and adds made meanwhile reach the graph."""
+    vectors = _unit_vectors(7)
+    index = VectorIndex(exact_search_max=4)
+    index.load(list(range(4)), vectors[:4], [""] * 4)
+    release = threading.Event()
+    build = _IndexState.build_hnsw
+
+    def slow_build(state, *rows):
+        release.wait(5)
+        return build(state, *rows)
+
+    with patch.object(_IndexState, "build_hnsw", slow_build):
+        index.add([4, 5], vectors[4:6], ["", ""])
+        index.add([6], vectors[6:], ["during build"])
+
+        assert index._state.hnsw is None
+        assert index.search(vectors[5], k=1)[0][0] == 5
+
+        release.set()
+        index._builder.join()
+
+    assert index._state.hnsw is not None
+    assert index.search(vectors[6], k=1)[0][:2] == (6, "during build")
+
+
+def test_quantize_int8_roundtrip():
+    """Test int8 quantization preserves cosine similarity to within 1%."""
+    vectors = _unit_vectors(10)
+    codes, scales = quantize_int8(vectors)
+    restored = codes.astype(np.float32) * scales[:, None]
+
+    cosine = np.sum(vectors * restored, axis=1) / np.linalg.norm(restored, axis=1)
+
+    assert codes.dtype == np.int8
+    assert np.all(cosine > 0.99)
+
+
+def test_quantized_search_matches_float():
+    """Test the int8 matrix ranks neighbours like the float32 matrix."""
+    vectors = _unit_vectors(200)
+    exact = VectorIndex()
+    quantized = VectorIndex(quantize=True)
+    for index in (exact, quantized):
+        index.load(list(range(200)), vectors, [""] * 200)
+
+    query = vectors[3] + 0.1 * vectors[4]
+
+    assert [r[0] for r in quantized.search(query, k=2)] == [r[0] for r in exact.search(query, k=2)]
+
+
+def test_pca_projection_search(tmp_path):
+    """Test a saved PCA projection reduces the index and keeps nearest neighbours."""
+    rng = np.random.default_rng(1)
+    vectors = (rng.normal(size=(300, 32)) @ rng.normal(size=(32, 768))).astype(np.float32)
+    path = str(tmp_path / "pca.npz")
+    PCAProjection.fit(vectors, 32).save(path)
+
+    index = VectorIndex(projection=PCAProjection.load(path))
+    index.load(list(range(300)), vectors, [""] * 300)
+
+    assert index.index_dim == 32
+    assert index.search(vectors[42], k=1)[0][0] == 42
+    assert PCAProjection.load(str(tmp_path / "missing.npz")) is None
+
+
+def test_pca_projection_preserves_scores():
+    """Test projected search reports the same cosine distances as unprojected search."""
+    rng = np.random.default_rng(2)
+    vectors = (rng.normal(size=(300, 32)) @ rng.normal(size=(32, 768)) + 5.0).astype(np.float32)
+    plain = VectorIndex()
+    projected = VectorIndex(projection=PCAProjection.fit(vectors, 33))
+    for index in (plain, projected):
+        index.load(list(range(300)), vectors, [""] * 300)
+
+    query = vectors[7] + 0.5 * vectors[8]
+    plain_results = plain.search(query, k=10)
+    projected_results = projected.search(query, k=10)
+
+    assert [r[0] for r in projected_results] == [r[0] for r in plain_results]
+    assert np.allclose([r[2] for r in projected_results], [r[2] for r in plain_results], atol=1e-4)
+
+
+def test_search_empty_index():
+    """Test searching an empty index returns no results."""
+    assert VectorIndex().search(np.ones(768), k=5) == []